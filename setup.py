@@ -11,6 +11,11 @@ setup(name='tap-klaviyo',
       py_modules=['tap_klaviyo'],
       install_requires=['singer-python==6.7.0',
                         'requests==2.33.0'],
+      extras_require={
+          'async': ['aiohttp'],
+          'streaming': ['ijson'],
+          'orjson': ['orjson']
+      },
       entry_points='''
           [console_scripts]
           tap-klaviyo=tap_klaviyo:main
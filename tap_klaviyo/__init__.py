@@ -1,11 +1,21 @@
 #!/usr/bin/env/python
 
+import asyncio
 import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from functools import partial
 import singer
 from singer import metadata, state as st
-from tap_klaviyo.utils import get_incremental_pull, get_full_pulls, get_all_using_next
+from tap_klaviyo.utils import get_incremental_pull, get_full_pulls, get_all_using_next, \
+    get_multiplexed_incremental_pull, get_updated_pulls, get_replication_method, \
+    RuntimeSettings, set_runtime_settings, get_runtime_settings, log_connection_stats, write_schema, flush_output, \
+    cache_metric, sync_stopped
+from tap_klaviyo.discovery_cache import get_discovery_cache
+from tap_klaviyo.output import use_utf8_stdout
+from tap_klaviyo.aio import async_get_incremental_pull, async_get_full_pulls, async_get_updated_pulls, \
+    create_client_session, run_concurrently
 
 LOGGER = singer.get_logger()
 
@@ -64,17 +74,23 @@ class Stream(object):
 
         # Resolve shared schema
         resolved_schema = singer.resolve_schema_references(stream_schema, refs)
+        # Full table streams with replication keys may also be synced incrementally,
+        # `replication-method` is then chosen in the catalog
+        selectable = self.replication_method == 'FULL_TABLE' and self.replication_keys
         mdata = metadata.to_map(
             metadata.get_standard_metadata(
                 schema = resolved_schema,
                 key_properties = self.key_properties,
                 valid_replication_keys=self.replication_keys, # Add replication key in the metadata of catalog
-                replication_method = self.replication_method
+                replication_method = None if selectable else self.replication_method
             )
         )
 
-        if self.replication_method == 'INCREMENTAL':
-            mdata = metadata.write(mdata, ('properties', 'timestamp'), 'inclusion', 'automatic')
+        if selectable:
+            mdata = metadata.write(mdata, (), 'replication-method', self.replication_method)
+        # The replication key is kept in the records, the bookmark of an incremental sync is read from it
+        for replication_key in self.replication_keys or []:
+            mdata = metadata.write(mdata, ('properties', replication_key), 'inclusion', 'automatic')
         self.metadata = metadata.to_list(mdata)
 
         return {
@@ -92,21 +108,24 @@ GLOBAL_EXCLUSIONS = Stream(
     'global_exclusions',
     'global_exclusions',
     ['id'],
-    'FULL_TABLE'
+    'FULL_TABLE',
+    ['updated']
 )
 
 LISTS = Stream(
     'lists',
     'lists',
     ['id'],
-    'FULL_TABLE'
+    'FULL_TABLE',
+    ['updated']
 )
 
 CAMPAIGNS = Stream(
     'campaigns',
     'campaigns',
     ['id'],
-    'FULL_TABLE'
+    'FULL_TABLE',
+    ['updated_at']
 )
 
 FULL_STREAMS = [GLOBAL_EXCLUSIONS, LISTS, CAMPAIGNS]
@@ -142,60 +161,164 @@ def translate_stream_to_metric_id(state, catalog):
         }
         for stream_name, bookmark_data in list(state.get('bookmarks', {}).items()):
             metric_id = stream_to_metric_id_map.get(stream_name)
-            if metric_id:
+            # Full table streams are bookmarked by their own name
+            if metric_id and metric_id != stream_name:
                 state['bookmarks'].pop(stream_name, None)
                 state = st.set_bookmark(state, metric_id, 'since', bookmark_data['since'])
     else:
         state['bookmarks'] = {}
     return state
 
-def do_sync(config, state, catalog, headers):
-    start_date = config['start_date'] if 'start_date' in config else None
+def sync_stream(stream, state, headers, start_date):
+    write_schema(stream)
+
+    try:
+        if stream['stream'] in EVENT_MAPPINGS.values():
+            get_incremental_pull(stream, ENDPOINTS['events'], state,
+                                headers, start_date)
+        elif get_replication_method(stream) == 'INCREMENTAL':
+            get_updated_pulls(stream, ENDPOINTS[stream['stream']], state, headers, start_date)
+        else:
+            get_full_pulls(stream, ENDPOINTS[stream['stream']], headers, state)
+    finally:
+        # Records buffered since the last state are written once the stream ends
+        flush_output()
+
+
+def sync_multiplexed_streams(streams, state, headers, start_date):
+    for stream in streams:
+        write_schema(stream)
+
+    try:
+        get_multiplexed_incremental_pull(streams, ENDPOINTS['events'], state,
+                                         headers, start_date)
+    finally:
+        flush_output()
+
+
+def get_sync_jobs(selected_streams, state, headers, start_date):
+    multiplexed_streams = []
+    if get_runtime_settings().multiplex_metric_streams:
+        # Only streams with a bookmark are combined, a stream syncing from the start date
+        # would make the combined query re-read the history of all the others
+        multiplexed_streams = [stream for stream in selected_streams
+                               if stream['stream'] in EVENT_MAPPINGS.values()
+                               and state.get('bookmarks', {}).get(stream['tap_stream_id']) is not None]
+    if len(multiplexed_streams) < 2:
+        multiplexed_streams = []
+
+    jobs = []
+    if multiplexed_streams:
+        jobs.append(partial(sync_multiplexed_streams, multiplexed_streams, state, headers, start_date))
+    for stream in selected_streams:
+        if stream not in multiplexed_streams:
+            jobs.append(partial(sync_stream, stream, state, headers, start_date))
+    return jobs
+
+
+async def async_sync_stream(client, stream, state, headers, start_date):
+    write_schema(stream)
+
+    try:
+        if stream['stream'] in EVENT_MAPPINGS.values():
+            await async_get_incremental_pull(client, stream, ENDPOINTS['events'], state,
+                                             headers, start_date)
+        elif get_replication_method(stream) == 'INCREMENTAL':
+            await async_get_updated_pulls(client, stream, ENDPOINTS[stream['stream']], state, headers, start_date)
+        else:
+            await async_get_full_pulls(client, stream, ENDPOINTS[stream['stream']], headers, state)
+    finally:
+        flush_output()
+
+
+async def async_do_sync(selected_streams, state, headers, start_date):
+    # Every pagination runs on one event loop and shares the connections and the rate limiter
+    max_concurrent_streams = get_runtime_settings().max_concurrent_streams
+    LOGGER.info("Syncing %s streams with the async engine, %s at a time",
+                len(selected_streams), max_concurrent_streams)
+    async with create_client_session() as client:
+        await run_concurrently(
+            [partial(async_sync_stream, client, stream, state, headers, start_date)
+             for stream in selected_streams],
+            max_concurrent_streams)
 
-    for stream in catalog.get('streams'):
-        mdata = metadata.to_map(stream['metadata'])
-        if metadata.get(mdata, (), 'selected'):
-            singer.write_schema(
-                stream['stream'],
-                stream['schema'],
-                stream['key_properties']
-            )
-
-            if stream['stream'] in EVENT_MAPPINGS.values():
-                get_incremental_pull(stream, ENDPOINTS['events'], state,
-                                    headers, start_date)
-            else:
-                get_full_pulls(stream, ENDPOINTS[stream['stream']], headers)
 
+def do_sync(config, state, catalog, headers):
+    start_date = config['start_date'] if 'start_date' in config else None
 
-def get_available_metrics(headers):
+    selected_streams = [stream for stream in catalog.get('streams')
+                        if metadata.get(metadata.to_map(stream['metadata']), (), 'selected')]
+    if get_runtime_settings().async_engine:
+        asyncio.run(async_do_sync(selected_streams, state, headers, start_date))
+        return
+
+    jobs = get_sync_jobs(selected_streams, state, headers, start_date)
+
+    max_concurrent_streams = get_runtime_settings().max_concurrent_streams
+    if max_concurrent_streams <= 1:
+        for job in jobs:
+            job()
+        return
+
+    # Streams share the connection pool and the rate limiter of the HTTP layer
+    LOGGER.info("Syncing %s streams with %s workers", len(selected_streams), max_concurrent_streams)
+    try:
+        with ThreadPoolExecutor(max_workers=max_concurrent_streams) as executor:
+            futures = [executor.submit(job) for job in jobs]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in done:
+                if future.exception() is not None:
+                    # The running streams stop at their next page and the queued ones are not started,
+                    # the executor then only waits for the pages being synced
+                    sync_stopped.set()
+                    for pending in futures:
+                        pending.cancel()
+                    raise future.exception()
+    finally:
+        sync_stopped.clear()
+
+
+def get_event_metrics(headers, discovery_cache=None):
+    """The metrics of the event streams, read from the discovery cache while it has not expired."""
+    metrics = discovery_cache.load() if discovery_cache else None
+    if metrics is None:
+        metrics = []
+        for page in get_all_using_next('metric_list',
+                                      ENDPOINTS['metrics'], headers, {}):
+            metrics.extend(page.data)
+        if discovery_cache:
+            discovery_cache.save(metrics)
+    # Every metric is cached, the event streams of a newer tap version are found in a cache written by an older one
+    return [metric for metric in metrics if metric['attributes']['name'] in EVENT_MAPPINGS]
+
+
+def get_available_metrics(headers, discovery_cache=None):
     metric_streams = []
-    for response in get_all_using_next('metric_list',
-                                  ENDPOINTS['metrics'], headers, {}):
-        for metric in response.json().get('data'):
-            metric_name = metric['attributes']['name']
-            if metric_name in EVENT_MAPPINGS:
-                metric_streams.append(
-                    Stream(
-                        stream=EVENT_MAPPINGS[metric_name],
-                        tap_stream_id=metric['id'],
-                        key_properties=["id"],
-                        replication_method='INCREMENTAL',
-                        replication_keys=["timestamp"]
-                    )
-                )
+    for metric in get_event_metrics(headers, discovery_cache):
+        # Kept for the records of the sync when it runs after the discovery
+        cache_metric(metric)
+        metric_streams.append(
+            Stream(
+                stream=EVENT_MAPPINGS[metric['attributes']['name']],
+                tap_stream_id=metric['id'],
+                key_properties=["id"],
+                replication_method='INCREMENTAL',
+                replication_keys=["timestamp"]
+            )
+        )
 
     return metric_streams
 
 
-def discover(headers):
-    metric_streams = get_available_metrics(headers)
+def discover(headers, discovery_cache=None):
+    # The catalog is built from the schemas of the installed tap, only the metrics are cached
+    metric_streams = get_available_metrics(headers, discovery_cache)
     return {"streams": [a.to_catalog_dict()
                         for a in metric_streams + FULL_STREAMS]}
 
 
-def do_discover(headers):
-    print(json.dumps(discover(headers), indent=2))
+def do_discover(headers, discovery_cache=None):
+    print(json.dumps(discover(headers, discovery_cache), indent=2))
 
 @singer.utils.handle_top_exception(LOGGER)
 def main():
@@ -206,15 +329,21 @@ def main():
         "revision": API_VERSION
     }
 
+    set_runtime_settings(RuntimeSettings.from_config(args.config))
+    use_utf8_stdout()
+    discovery_cache = get_discovery_cache(args.config, API_VERSION)
+
     if args.discover:
-        do_discover(headers)
+        do_discover(headers, discovery_cache)
 
     else:
-        catalog = args.catalog.to_dict() if args.catalog else discover(headers)
+        catalog = args.catalog.to_dict() if args.catalog else discover(headers, discovery_cache)
 
         state = translate_stream_to_metric_id(args.state, catalog)
 
         do_sync(args.config, state, catalog, headers)
 
+    log_connection_stats()
+
 if __name__ == '__main__':
     main()
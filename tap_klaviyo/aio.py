@@ -0,0 +1,203 @@
+import asyncio
+import time
+from functools import partial
+import backoff
+import simplejson
+from singer import metrics, state as st
+
+from tap_klaviyo.utils import (Page, KlaviyoBackoffError, KlaviyoNotFoundError, KlaviyoBadRequestError, get_error,
+                               retry_after_expo, get_runtime_settings, get_rate_limiter, get_starting_point,
+                               get_event_params, get_page_size_params, get_latest_event_time, update_state,
+                               transfrom_and_write_records, output_lock, get_json_codec, StateCheckpoint, BoundaryIds,
+                               FullTableCheckpoint, get_stream_params, select_records, INCREMENTAL_REPLICATION_KEYS,
+                               get_updated_since, get_updated_params, get_latest_updated,
+                               get_event_relationships, get_cached_metric, get_metric_request, cache_metric,
+                               logger)
+
+# aiohttp is only required when the `async_engine` config is enabled
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+if aiohttp is not None:
+    CONNECTION_ERRORS = (asyncio.TimeoutError, aiohttp.ClientConnectionError)
+else:
+    CONNECTION_ERRORS = (asyncio.TimeoutError,)
+
+
+def create_client_session():
+    """Build the aiohttp session shared by every pagination of the event loop."""
+    if aiohttp is None:
+        raise ImportError("The async engine requires aiohttp, install it with `pip install tap-klaviyo[async]`")
+    settings = get_runtime_settings()
+    connector = aiohttp.TCPConnector(limit=settings.pool_size)
+    return aiohttp.ClientSession(connector=connector,
+                                 timeout=aiohttp.ClientTimeout(total=settings.request_timeout))
+
+
+# Same retries as `authed_get`
+@backoff.on_exception(backoff.expo, CONNECTION_ERRORS, max_tries=5, factor=2)
+@backoff.on_exception(retry_after_expo, (simplejson.scanner.JSONDecodeError, KlaviyoBackoffError), max_tries=3)
+async def async_authed_get(client, source, url, params, headers):
+    rate_limiter = get_rate_limiter()
+    # Wait for the endpoint budget shared with every other pagination before sending
+    delay = rate_limiter.reserve(url)
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+    with metrics.http_request_timer(source) as timer:
+        start_time = time.monotonic()
+        async with client.get(url, params=params, headers=headers) as resp:
+            retry_after = rate_limiter.record(url, resp.status, resp.headers)
+            content = await resp.read()
+
+        if resp.status != 200:
+            try:
+                json_resp = get_json_codec().loads(content)
+            except (ValueError, TypeError):
+                json_resp = {}
+            raise get_error(resp.status, json_resp if isinstance(json_resp, dict) else {}, retry_after)
+
+        body = get_json_codec().loads(content)
+        timer.tags[metrics.Tag.http_status_code] = resp.status
+        return Page(body, resp.status, time.monotonic() - start_time)
+
+
+async def async_get_all_using_next(client, stream, url, headers, params):
+    # Paginate till there is a url or next url.
+    while url:
+        page = await async_authed_get(client, stream, url, params, headers)
+        # Re-initializing params to {} as next url contains all necessary params.
+        params = {}
+        yield page
+        url = page.next_url
+
+
+async def async_get_local_included(client, stream, endpoint, headers):
+    """Same as `LocalIncluded.get` for a single stream."""
+    if 'metric' not in get_event_relationships([stream]):
+        return {}
+    metric = get_cached_metric(stream['tap_stream_id'])
+    if metric is None:
+        url, params = get_metric_request(endpoint, stream)
+        try:
+            metric = cache_metric((await async_authed_get(client, 'metric', url, params, headers)).data)
+        except KlaviyoNotFoundError:
+            logger.warning("Metric %s was not found, the metric of the %s records is not resolved",
+                           stream['tap_stream_id'], stream['stream'])
+            return {}
+    return {('metric', stream['tap_stream_id']): metric}
+
+
+async def async_get_incremental_pull(client, stream, endpoint, state, headers, start_date):
+    latest_event_time = get_starting_point(stream, state, start_date)
+
+    with metrics.record_counter(stream['stream']) as counter, StateCheckpoint(state) as checkpoint:
+        params = get_event_params(stream, latest_event_time)
+        valid_relationships = get_event_relationships([stream])
+        # Loaded with the first page which has events, like `LocalIncluded`
+        local_included = None
+        boundary_ids = BoundaryIds(state, stream['tap_stream_id'])
+        async for page in async_get_all_using_next(client, stream['stream'], endpoint, headers, params):
+            events = boundary_ids.filter(page.data or [])
+
+            if events:
+                if local_included is None:
+                    local_included = await async_get_local_included(client, stream, endpoint, headers)
+                counter.increment(len(events))
+                transfrom_and_write_records(events, stream, {**page.index_included(), **local_included},
+                                            valid_relationships)
+                with output_lock:
+                    update_state(state, stream['tap_stream_id'], get_latest_event_time(events))
+                    boundary_ids.update_state(state, stream['tap_stream_id'])
+                    checkpoint.page_done()
+
+    return state
+
+
+async def async_get_resumed_pages(client, stream, url, headers, params, endpoint, endpoint_params):
+    """Same as `get_resumed_pages`."""
+    pages = async_get_all_using_next(client, stream, url, headers, params)
+    if url != endpoint:
+        try:
+            first_page = await pages.__anext__()
+        except StopAsyncIteration:
+            return
+        except KlaviyoBadRequestError:
+            logger.warning("Could not resume %s from its saved page, restarting its params set", stream)
+            pages = async_get_all_using_next(client, stream, endpoint, headers, endpoint_params)
+        else:
+            yield first_page
+    async for page in pages:
+        yield page
+
+
+async def async_get_full_pulls(client, resource, endpoint, headers, state):
+    """Same as `get_full_pulls`, the params sets run on the event loop of the streams."""
+    stream_params = get_stream_params(resource['stream'])
+    checkpoint = FullTableCheckpoint(state, resource, len(stream_params))
+    state_checkpoint = StateCheckpoint(state)
+
+    async def sync_params_set(params_index, params, counter):
+        params = {**params, **get_page_size_params(resource['stream'])}
+        url, request_params = checkpoint.get_request(params_index, endpoint, params)
+        async for page in async_get_resumed_pages(client, resource['stream'], url, headers, request_params,
+                                                  endpoint, params):
+            records = select_records(resource['stream'], page.data)
+            counter.increment(len(records))
+            transfrom_and_write_records(records, resource, page.index_included(), params.get("include","").split(","),
+                                        checkpoint.version)
+            checkpoint.page_done(params_index, page.next_url)
+            state_checkpoint.page_done()
+
+    with metrics.record_counter(resource['stream']) as counter, state_checkpoint:
+        checkpoint.start()
+        await run_concurrently(
+            [partial(sync_params_set, params_index, params, counter)
+             for params_index, params in enumerate(stream_params)
+             if not checkpoint.is_complete(params_index)],
+            get_runtime_settings().max_concurrent_params_sets)
+        checkpoint.complete()
+        state_checkpoint.write()
+
+
+async def async_get_updated_pulls(client, resource, endpoint, state, headers, start_date):
+    """Same as `get_updated_pulls`."""
+    replication_key = INCREMENTAL_REPLICATION_KEYS[resource['stream']]
+    since = latest = get_updated_since(resource, state, start_date)
+
+    with metrics.record_counter(resource['stream']) as counter, StateCheckpoint(state) as state_checkpoint:
+        for params in get_stream_params(resource['stream']):
+            params = {**get_updated_params(resource['stream'], params, since),
+                      **get_page_size_params(resource['stream'])}
+            async for page in async_get_all_using_next(client, resource['stream'], endpoint, headers, params):
+                records = select_records(resource['stream'], page.data)
+                counter.increment(len(records))
+                latest = get_latest_updated(latest, records, replication_key)
+                transfrom_and_write_records(records, resource, page.index_included(), params.get("include","").split(","))
+        if latest is not None:
+            with output_lock:
+                st.set_bookmark(state, resource['tap_stream_id'], 'since', latest)
+                state_checkpoint.write()
+
+
+async def run_concurrently(jobs, limit):
+    """Run the coroutine functions with at most `limit` at a time, the first error cancels the others."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(job):
+        async with semaphore:
+            return await job()
+
+    tasks = [asyncio.ensure_future(run(job)) for job in jobs]
+    if not tasks:
+        return
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        if task.exception() is not None:
+            raise task.exception()
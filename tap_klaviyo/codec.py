@@ -0,0 +1,80 @@
+import math
+import simplejson
+
+# orjson is used to decode the responses and encode the records when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class SimplejsonCodec:
+    """The behaviour of `requests` and `singer-python`, used when no faster backend is installed."""
+    name = "simplejson"
+
+    def loads(self, data):
+        return simplejson.loads(data)
+
+    def decode_response(self, response):
+        return response.json()
+
+    def dumps(self, obj):
+        # Same options as `singer.messages.format_message`
+        return simplejson.dumps(obj, use_decimal=True, ensure_ascii=True, allow_nan=False)
+
+
+class OrjsonCodec(SimplejsonCodec):
+    """
+    orjson backend. Anything orjson rejects, e.g. an invalid body, integers over 64 bits or
+    Decimals, goes through simplejson so the output and the raised `JSONDecodeError` do not change.
+    orjson writes NaN and Infinity as null, such objects also go through simplejson which raises
+    on them. Non ASCII characters are not escaped, stdout is UTF-8 (see `use_utf8_stdout`).
+    """
+    name = "orjson"
+
+    def loads(self, data):
+        try:
+            return orjson.loads(data) # pylint: disable=no-member
+        except (orjson.JSONDecodeError, TypeError): # pylint: disable=no-member
+            return simplejson.loads(data)
+
+    def decode_response(self, response):
+        return self.loads(response.content)
+
+    def dumps(self, obj):
+        try:
+            encoded = orjson.dumps(obj) # pylint: disable=no-member
+        except TypeError:
+            return super().dumps(obj)
+        # Non finite floats can only have been written as null
+        if b"null" in encoded and has_non_finite_float(obj):
+            return super().dumps(obj)
+        return encoded.decode("utf-8")
+
+
+def has_non_finite_float(obj):
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(has_non_finite_float(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(has_non_finite_float(value) for value in obj)
+    return False
+
+
+JSON_BACKENDS = {
+    SimplejsonCodec.name: SimplejsonCodec,
+    OrjsonCodec.name: OrjsonCodec,
+}
+
+
+def get_codec(backend="auto"):
+    """Return the codec of the `json_backend` config, "auto" picks the fastest installed one."""
+    if backend == "auto" or backend is None:
+        backend = OrjsonCodec.name if orjson is not None else SimplejsonCodec.name
+    if backend == OrjsonCodec.name and orjson is None:
+        raise ImportError("The orjson JSON backend requires orjson, install it with `pip install tap-klaviyo[orjson]`")
+    if backend not in JSON_BACKENDS:
+        raise ValueError("Unknown json_backend '{}', expected one of: auto, {}".format(
+            backend, ", ".join(JSON_BACKENDS)))
+    return JSON_BACKENDS[backend]()
@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import singer
+from tap_klaviyo.utils import get_boolean, get_positive_float
+
+LOGGER = singer.get_logger()
+
+# Seconds the metrics found by a discovery are reused for
+DISCOVERY_CACHE_TTL = 24 * 60 * 60
+
+
+class DiscoveryCache:
+    """
+    The metrics found by the discovery, kept on disk between runs so the metrics endpoint is not
+    paged again until `ttl` seconds have passed. Every metric of the account is kept, they are
+    matched with the event streams of the installed tap version once loaded. The file is keyed
+    by a hash of the API key and by the API revision, the key itself is never written.
+    """
+
+    def __init__(self, directory, api_key, api_version, ttl=DISCOVERY_CACHE_TTL, refresh=False):
+        key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(directory, "tap-klaviyo-discovery-{}-{}.json".format(key, api_version))
+        self.ttl = ttl
+        self.refresh = refresh
+
+    def load(self):
+        """Return the cached metrics, or None when there are none, they expired or a refresh was asked."""
+        if self.refresh:
+            return None
+        try:
+            with open(self.path) as cache_file:
+                cached = json.load(cache_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            LOGGER.warning("Could not read the discovery cache %s: %s", self.path, e)
+            return None
+        if not isinstance(cached, dict) or time.time() - cached.get("created_at", 0) > self.ttl:
+            return None
+        LOGGER.info("Using the metrics discovered at %s from %s",
+                    time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(cached["created_at"])), self.path)
+        return cached.get("metrics")
+
+    def save(self, metrics):
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # Written to a temporary file first so a concurrent run never reads a partial cache
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+            with os.fdopen(fd, "w") as cache_file:
+                json.dump({"created_at": time.time(), "metrics": metrics}, cache_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            LOGGER.warning("Could not write the discovery cache %s: %s", self.path, e)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def get_discovery_cache(config, api_version):
+    """The cache of the `discovery_cache_dir` config, None when it is not set."""
+    if not config.get("discovery_cache_dir"):
+        return None
+    return DiscoveryCache(config["discovery_cache_dir"], config.get("api_key") or "", api_version,
+                          ttl=get_positive_float(config, "discovery_cache_ttl", DISCOVERY_CACHE_TTL),
+                          refresh=get_boolean(config, "refresh_discovery_cache"))
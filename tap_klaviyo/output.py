@@ -0,0 +1,48 @@
+import sys
+import time
+
+# Buffered messages are written once they reach this many characters
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+# or once this many seconds passed since the last write
+OUTPUT_FLUSH_INTERVAL = 1.0
+
+
+def use_utf8_stdout():
+    """
+    Encode stdout as UTF-8 whatever the locale is, the orjson codec writes non ASCII
+    characters without escaping them.
+    """
+    if getattr(sys.stdout, "encoding", None) and sys.stdout.encoding.lower().replace("-", "") != "utf8" \
+            and hasattr(sys.stdout, "reconfigure"):
+        sys.stdout.reconfigure(encoding="utf-8")
+
+
+class MessageBuffer:
+    """
+    Collects serialized messages and writes them to stdout with a single write and flush.
+    Messages are kept in the order they were added, callers hold `output_lock` and flush
+    the buffer before writing any message which does not go through it, e.g. SCHEMA and STATE.
+    """
+
+    def __init__(self, max_size=OUTPUT_BUFFER_SIZE, max_interval=OUTPUT_FLUSH_INTERVAL):
+        self.max_size = max_size
+        self.max_interval = max_interval
+        self.chunks = []
+        self.size = 0
+        self.flushed_at = time.monotonic()
+
+    def write(self, chunk):
+        """Add newline terminated messages, written out once a size or time threshold is reached."""
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        if self.size >= self.max_size or time.monotonic() - self.flushed_at >= self.max_interval:
+            self.flush()
+
+    def flush(self):
+        if self.chunks:
+            # stdout is looked up on each flush so redirections of `sys.stdout` are honoured
+            sys.stdout.write("".join(self.chunks))
+            sys.stdout.flush()
+            self.chunks = []
+            self.size = 0
+        self.flushed_at = time.monotonic()
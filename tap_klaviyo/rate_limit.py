@@ -0,0 +1,169 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+BURST_WINDOW = 1
+STEADY_WINDOW = 60
+
+# Documented burst (per second) and steady (per minute) limits of the endpoints used by the tap
+# Profiles are requested with `additional-fields[profile]=predictive_analytics` which lowers their limits
+# Other endpoints are only paced once Klaviyo reports their limits in the response headers
+ENDPOINT_RATE_LIMITS = {
+    "/api/events": {BURST_WINDOW: 350, STEADY_WINDOW: 3500},
+    "/api/lists": {BURST_WINDOW: 75, STEADY_WINDOW: 700},
+    "/api/profiles": {BURST_WINDOW: 10, STEADY_WINDOW: 150},
+    "/api/metrics": {BURST_WINDOW: 10, STEADY_WINDOW: 150},
+    "/api/campaigns": {BURST_WINDOW: 10, STEADY_WINDOW: 150},
+}
+
+
+def parse_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_limit_policies(value):
+    """
+    Parse a `RateLimit-Limit` header, e.g. "10, 10;w=1, 150;w=60".
+    Returns the quota `RateLimit-Remaining` refers to and a dict of window seconds -> allowed requests.
+    """
+    current_quota, policies = None, {}
+    if not isinstance(value, str):
+        return current_quota, policies
+    for item in value.split(","):
+        parts = [part.strip() for part in item.split(";")]
+        quota = parse_number(parts[0])
+        if len(parts) == 1 and current_quota is None:
+            current_quota = quota
+        for part in parts[1:]:
+            if part.startswith("w="):
+                window = parse_number(part[2:])
+                if quota and window:
+                    policies[window] = quota
+    return current_quota, policies
+
+
+def get_endpoint_key(url):
+    # Rate limits apply per endpoint, so "/api/metrics/<id>" shares the "/api/metrics" budget
+    path = urlparse(url).path
+    return "/".join(path.rstrip("/").split("/")[:3])
+
+
+class TokenBucket:
+    """A token bucket refilled continuously with `capacity` tokens per `window` seconds."""
+
+    def __init__(self, capacity, window):
+        self.capacity = capacity
+        self.window = window
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.capacity / self.window)
+        self.updated = now
+
+    def reserve(self, now):
+        """Take a token and return the seconds to wait before it may be used."""
+        self.refill(now)
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens * self.window / self.capacity
+
+    def resize(self, capacity, now):
+        self.refill(now)
+        self.capacity = capacity
+        self.tokens = min(self.tokens, capacity)
+
+    def limit_remaining(self, remaining, now):
+        # Never assume more tokens than Klaviyo reports as remaining
+        self.refill(now)
+        self.tokens = min(self.tokens, remaining)
+
+
+class EndpointRateLimiter:
+    """Token buckets for each rate limit window of one endpoint, adjusted from Klaviyo response headers."""
+
+    def __init__(self, limits, fraction=1.0):
+        self.fraction = fraction
+        self.buckets = {window: TokenBucket(self.scale(quota), window) for window, quota in limits.items()}
+        self.blocked_until = 0
+
+    def scale(self, quota):
+        return max(quota * self.fraction, 1)
+
+    def reserve(self, now):
+        delays = [bucket.reserve(now) for bucket in self.buckets.values()]
+        return max(delays + [self.blocked_until - now, 0])
+
+    def record(self, status_code, headers, now):
+        headers = headers or {}
+        current_quota, policies = parse_limit_policies(headers.get("RateLimit-Limit"))
+        # The remaining count refers to the window of the current quota, the longest one by default
+        remaining_window = max(policies) if policies else max(self.buckets, default=None)
+        for window, quota in policies.items():
+            bucket = self.buckets.get(window)
+            if bucket is None:
+                self.buckets[window] = TokenBucket(self.scale(quota), window)
+            else:
+                bucket.resize(self.scale(quota), now)
+            if quota == current_quota:
+                remaining_window = window
+
+        remaining = parse_number(headers.get("RateLimit-Remaining"))
+        reset = parse_number(headers.get("RateLimit-Reset"))
+        if remaining is not None:
+            if remaining <= 0 and reset:
+                self.block(reset, now)
+            elif remaining_window is not None:
+                self.buckets[remaining_window].limit_remaining(remaining, now)
+
+        if status_code == 429:
+            retry_after = parse_number(headers.get("Retry-After"))
+            if retry_after is not None:
+                self.block(retry_after, now)
+            return retry_after
+        return None
+
+    def block(self, seconds, now):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class RateLimiter:
+    """
+    Client side rate limiter shared by every request of the tap.
+    `reserve` returns the seconds a caller has to wait so that the synchronous and the
+    asynchronous HTTP layers can both pace their requests with it.
+    """
+
+    def __init__(self, fraction=1.0, limits=None):
+        self.fraction = fraction
+        self.limits = ENDPOINT_RATE_LIMITS if limits is None else limits
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def get_endpoint(self, url):
+        key = get_endpoint_key(url)
+        endpoint = self.endpoints.get(key)
+        if endpoint is None:
+            endpoint = EndpointRateLimiter(self.limits.get(key, {}), self.fraction)
+            self.endpoints[key] = endpoint
+        return endpoint
+
+    def reserve(self, url):
+        with self.lock:
+            return self.get_endpoint(url).reserve(time.monotonic())
+
+    def acquire(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def record(self, url, status_code, headers):
+        """Update the endpoint budget from the response headers, returns `Retry-After` if sent."""
+        with self.lock:
+            return self.get_endpoint(url).record(status_code, headers, time.monotonic())
@@ -0,0 +1,130 @@
+import requests
+import simplejson
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+
+# ijson is only required when the `streaming_parse` config is enabled
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+# Number of resolved records handed to the writer at once
+STREAM_BATCH_SIZE = 50
+
+TOP_LEVEL_ITEMS = {
+    "data.item": "data",
+    "included.item": "included",
+    "links": "links",
+}
+
+
+def iter_top_level_items(raw):
+    """
+    Parse a JSON:API body incrementally and yield ("data", item), ("included", item) and
+    ("links", links) as soon as each of them has been read, without building the whole body.
+    """
+    builder, builder_prefix = None, None
+    for prefix, event, value in ijson.parse(raw, use_float=True):
+        if builder is None:
+            if prefix in TOP_LEVEL_ITEMS and event in ("start_map", "start_array"):
+                builder, builder_prefix = ObjectBuilder(), prefix
+            elif prefix in TOP_LEVEL_ITEMS and event not in ("end_map", "end_array"):
+                # scalar item, e.g. a null `links`
+                yield TOP_LEVEL_ITEMS[prefix], value
+                continue
+            else:
+                continue
+        builder.event(event, value)
+        if prefix == builder_prefix and event in ("end_map", "end_array"):
+            yield TOP_LEVEL_ITEMS[builder_prefix], builder.value
+            builder, builder_prefix = None, None
+
+
+def get_relationship_ids(record, valid_relationships):
+    ids = set()
+    for relationship_key, relationship_value in (record.get('relationships') or {}).items():
+        if relationship_key not in valid_relationships:
+            continue
+        relationship_data = (relationship_value or {}).get('data') or []
+        if isinstance(relationship_data, dict):
+            relationship_data = [relationship_data]
+        ids.update((relationship.get('type'), relationship['id']) for relationship in relationship_data)
+    return ids
+
+
+class StreamedPage:
+    """
+    A page parsed while it is read from the socket. `iter_batches` yields the records in batches
+    as soon as all their included relationships have been read, together with the included map
+    by (type, id) to resolve them. `next_url` is known once the page has been iterated.
+    """
+
+    def __init__(self, response, status_code=200, elapsed=0.0, url=None, params=None):
+        self.response = response
+        self.status_code = status_code
+        self.elapsed = elapsed
+        self.next_url = None
+        # The request of the page, sent again when reading its body fails
+        self.url = url
+        self.params = params
+
+    def reload(self, response):
+        """Read the page again from a new response."""
+        self.close()
+        self.response = response
+        self.next_url = None
+
+    def iter_batches(self, valid_relationships, flatten_included=None, known_included=None):
+        # `known_included` are the relationships resolved without being part of the page
+        included = dict(known_included or {})
+        # records waiting for included relationships, with the ids still missing
+        pending = []
+        ready = []
+        try:
+            for kind, item in self.iter_items():
+                if kind == "data":
+                    missing = get_relationship_ids(item, valid_relationships) - included.keys()
+                    if missing:
+                        pending.append((item, missing))
+                    else:
+                        ready.append(item)
+                elif kind == "included":
+                    key = (item.get('type'), item['id'])
+                    included[key] = flatten_included(item) if flatten_included else item
+                    still_pending = []
+                    for record, missing in pending:
+                        missing.discard(key)
+                        if missing:
+                            still_pending.append((record, missing))
+                        else:
+                            ready.append(record)
+                    pending = still_pending
+                elif kind == "links":
+                    self.next_url = (item or {}).get('next')
+
+                if len(ready) >= STREAM_BATCH_SIZE:
+                    yield ready, included
+                    ready = []
+        finally:
+            self.close()
+
+        # Relationships which are not in `included` are left unresolved like in `transfrom_and_write_records`
+        ready.extend(record for record, _ in pending)
+        if ready:
+            yield ready, included
+
+    def iter_items(self):
+        """
+        `iter_top_level_items` of the body. The body is read after the request returned, so read
+        errors are raised like `requests` raises them for a body read at once, to be retried.
+        """
+        try:
+            yield from iter_top_level_items(self.response.raw)
+        except ijson.JSONError as e:
+            raise simplejson.JSONDecodeError(str(e), "", 0) from e
+        except (Urllib3HTTPError, OSError) as e:
+            raise requests.ConnectionError(e) from e
+
+    def close(self):
+        self.response.close()
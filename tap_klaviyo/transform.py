@@ -0,0 +1,231 @@
+import copy
+import datetime
+import re
+from singer import metadata, Transformer
+from singer.transform import string_to_datetime
+from singer.utils import strftime
+
+# Returned by the compiled converters when a value does not match its schema
+FAIL = object()
+
+# ISO 8601 datetimes parsed without dateutil, anything else goes through `string_to_datetime`
+ISO_DATETIME_RE = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{3}|\.\d{6})?(Z|[+-]\d{2}:\d{2})$")
+
+
+def convert_datetime(data):
+    if data is None or data == "":
+        return FAIL
+    if isinstance(data, str) and ISO_DATETIME_RE.match(data):
+        try:
+            value = datetime.datetime.fromisoformat(data.replace("Z", "+00:00"))
+            return strftime(value.astimezone(datetime.timezone.utc))
+        except ValueError:
+            pass
+    value = string_to_datetime(data)
+    return FAIL if value is None else value
+
+
+def convert_null(data):
+    if data is None or data == "":
+        return None
+    return FAIL
+
+
+def convert_string(data):
+    if data is None:
+        return FAIL
+    try:
+        return str(data)
+    except Exception: # pylint: disable=broad-except
+        return FAIL
+
+
+def convert_integer(data):
+    if isinstance(data, str):
+        data = data.replace(",", "")
+    try:
+        return int(data)
+    except Exception: # pylint: disable=broad-except
+        return FAIL
+
+
+def convert_number(data):
+    if isinstance(data, str):
+        data = data.replace(",", "")
+    try:
+        return float(data)
+    except Exception: # pylint: disable=broad-except
+        return FAIL
+
+
+def convert_boolean(data):
+    if isinstance(data, str) and data.lower() == "false":
+        return False
+    try:
+        return bool(data)
+    except Exception: # pylint: disable=broad-except
+        return FAIL
+
+
+def compile_object(schema, pattern_properties):
+    properties = {key: compile_schema(sub_schema) for key, sub_schema in schema.items()}
+    patterns = [(re.compile(pattern), compile_schema(sub_schema))
+                for pattern, sub_schema in (pattern_properties or {}).items()]
+
+    if schema == {} and not pattern_properties:
+        def convert_any_object(data):
+            return data if isinstance(data, dict) else FAIL
+        return convert_any_object
+
+    def convert_object(data):
+        if not isinstance(data, dict):
+            return FAIL
+        result = {}
+        for key, value in data.items():
+            convert = properties.get(key)
+            if convert is None:
+                # Same as an `anyOf` of the matching pattern schemas
+                matching = [convert for pattern, convert in patterns if pattern.match(key)]
+                if not matching:
+                    # Not in the schema, the field is removed
+                    continue
+                convert = compile_any_of(matching)
+            value = convert(value)
+            if value is FAIL:
+                return FAIL
+            result[key] = value
+        return result
+    return convert_object
+
+
+def compile_array(schema):
+    convert_item = compile_schema(schema)
+
+    def convert_array(data):
+        if not isinstance(data, list):
+            return FAIL
+        result = []
+        for item in data:
+            item = convert_item(item)
+            if item is FAIL:
+                return FAIL
+            result.append(item)
+        return result
+    return convert_array
+
+
+def compile_type(typ, schema):
+    if typ == "null":
+        return convert_null
+    if typ == "string" and schema.get("format") == "date-time":
+        return convert_datetime
+    if typ == "object":
+        return compile_object(schema.get("properties", {}), schema.get("patternProperties"))
+    if typ == "array" and "items" in schema:
+        return compile_array(schema["items"])
+    if typ == "string" and schema.get("format") != "singer.decimal":
+        return convert_string
+    if typ == "integer":
+        return convert_integer
+    if typ == "number":
+        return convert_number
+    if typ == "boolean":
+        return convert_boolean
+
+    # Other types and formats, e.g. "singer.decimal", are converted by `singer.Transformer`
+    transformer = Transformer()
+
+    def convert_other(data):
+        # pylint: disable=protected-access
+        success, value = transformer._transform(data, typ, schema, [])
+        return value if success else FAIL
+    return convert_other
+
+
+def compile_any_of(converters):
+    def convert_any_of(data):
+        for convert in converters:
+            value = convert(data)
+            if value is not FAIL:
+                return value
+        return FAIL
+    return convert_any_of
+
+
+def compile_schema(schema):
+    """Build a function converting a value like `Transformer.transform_recur` does for `schema`."""
+    if "anyOf" in schema:
+        return compile_any_of([compile_schema(sub_schema) for sub_schema in schema["anyOf"]])
+
+    if "type" not in schema:
+        return lambda data: data
+
+    types = schema["type"]
+    if not isinstance(types, list):
+        types = [types]
+    # null is always tried last
+    types = [typ for typ in types if typ != "null"] + (["null"] if "null" in types else [])
+
+    converters = [compile_type(typ, schema) for typ in types]
+    if len(converters) == 1:
+        return converters[0]
+    if len(converters) == 2 and converters[1] is convert_null:
+        convert_value = converters[0]
+
+        def convert_nullable(data):
+            value = convert_value(data)
+            if value is FAIL:
+                return convert_null(data)
+            return value
+        return convert_nullable
+    return compile_any_of(converters)
+
+
+def get_deselected_fields(mdata):
+    """
+    Return the top level fields `Transformer.filter_data_by_metadata` removes, or None when
+    the metadata also deselects nested fields.
+    """
+    deselected = set()
+    for breadcrumb, field_mdata in mdata.items():
+        if breadcrumb == () or field_mdata.get('inclusion') == 'automatic':
+            continue
+        if field_mdata.get('selected') is False or field_mdata.get('inclusion') == 'unsupported':
+            if len(breadcrumb) != 2 or breadcrumb[0] != 'properties':
+                return None
+            deselected.add(breadcrumb[1])
+    return deselected
+
+
+class CompiledTransformer:
+    """
+    Same output as `singer.Transformer().transform(record, schema, mdata)`, the schema and the
+    field selection are resolved once instead of for every record.
+    Records which do not match the schema are transformed again with `singer.Transformer`
+    so the raised `SchemaMismatch` is unchanged.
+    """
+
+    def __init__(self, schema, mdata):
+        self.schema = schema
+        self.mdata = mdata
+        self.deselected = get_deselected_fields(mdata) if mdata else set()
+        self.convert = compile_schema(schema)
+
+    def filter(self, record):
+        if self.deselected is None:
+            # Fields are removed in place, the included objects of the record are shared with other records
+            return Transformer().filter_data_by_metadata(copy.deepcopy(record), self.mdata)
+        if isinstance(record, dict) and self.deselected:
+            return {key: value for key, value in record.items() if key not in self.deselected}
+        return record
+
+    def transform(self, record):
+        value = self.convert(self.filter(record))
+        if value is FAIL:
+            with Transformer() as transformer:
+                return transformer.transform(copy.deepcopy(record), self.schema, self.mdata)
+        return value
+
+
+def compile_transformer(stream):
+    return CompiledTransformer(stream['schema'], metadata.to_map(stream['metadata']))
@@ -1,19 +1,254 @@
 import datetime
+import queue
+import threading
 import time
+from urllib.parse import urljoin
+from collections import namedtuple, defaultdict
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 import singer
-from singer import metrics, metadata, Transformer, state as st
+from singer import metrics, metadata, state as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import backoff
 import simplejson
+from tap_klaviyo.rate_limit import RateLimiter
+from tap_klaviyo.streaming import StreamedPage, ijson
+from tap_klaviyo.codec import get_codec
+from tap_klaviyo.transform import compile_transformer
+from tap_klaviyo.output import MessageBuffer, OUTPUT_BUFFER_SIZE, OUTPUT_FLUSH_INTERVAL
 
 DATETIME_FMT = "%Y-%m-%dT%H:%M:%SZ"
 
 # set default timeout of 300 seconds
 REQUEST_TIMEOUT = 300
 
-session = requests.Session()
+# Number of keep-alive connections kept open to Klaviyo
+POOL_SIZE = 10
+# Number of times the adapter retries establishing a connection
+CONNECTION_RETRIES = 3
+
+# A backfill is only split into slices covering at least a day each
+MIN_BACKFILL_SLICE_SECONDS = 24 * 60 * 60
+
+# Number of times a streamed page is read before its read errors are raised
+STREAMED_PAGE_TRIES = 3
+
+# Maximum number of event ids kept in the bookmark to skip the events of its second on the next sync
+MAX_BOUNDARY_IDS = 1000
+
+# Maximum `page[size]` accepted by the endpoints which support it
+MAX_PAGE_SIZE = {
+    "global_exclusions": 100
+}
+
 logger = singer.get_logger()
 
+# Serializes the messages of concurrently synced streams so lines are never interleaved
+output_lock = threading.RLock()
+
+
+def build_session(pool_size=POOL_SIZE, connection_retries=CONNECTION_RETRIES):
+    """
+    Build a session with a keep-alive connection pool mounted for https.
+    Only connection establishment is retried at the adapter level, read errors and
+    HTTP error codes are retried by the backoff decorators of `authed_get`.
+    """
+    new_session = requests.Session()
+    retries = Retry(total=connection_retries, connect=connection_retries,
+                    read=0, status=0, other=0, backoff_factor=0.5)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    new_session.mount('https://', adapter)
+    new_session.mount('http://', adapter)
+    new_session.headers.update({'Connection': 'keep-alive'})
+    return new_session
+
+
+session = build_session()
+
+
+def get_positive_int(config, key, default):
+    # only return the value if it is passed in the config and the value is not 0, "0" or ""
+    value = config.get(key)
+    if value and int(float(value)) > 0:
+        return int(float(value))
+    return default
+
+
+def get_non_negative_int(config, key, default):
+    # same as `get_positive_int` for settings where 0 is a valid value, e.g. a number of retries
+    value = config.get(key)
+    if value not in (None, "") and int(float(value)) >= 0:
+        return int(float(value))
+    return default
+
+
+def get_positive_float(config, key, default):
+    # same as `get_positive_int` for settings accepting fractions, e.g. seconds
+    value = config.get(key)
+    if value and float(value) > 0:
+        return float(value)
+    return default
+
+
+# return the 'timeout'
+def get_request_timeout(config):
+    # get the value of request timeout from config
+    config_request_timeout = config.get('request_timeout')
+
+    # only return the timeout value if it is passed in the config and the value is not 0, "0" or ""
+    if config_request_timeout and float(config_request_timeout):
+        # return the timeout from config
+        return float(config_request_timeout)
+
+    # return default timeout
+    return REQUEST_TIMEOUT
+
+
+def get_boolean(config, key):
+    # accept both booleans and their string form, e.g. "true"
+    value = config.get(key)
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1', 'yes')
+    return bool(value)
+
+
+def get_rate_limit_fraction(config):
+    # share of the documented Klaviyo rate limits the tap may use, between 0 and 1
+    value = config.get('rate_limit_fraction')
+    if value and 0 < float(value) <= 1:
+        return float(value)
+    return 1.0
+
+
+class RuntimeSettings(namedtuple('RuntimeSettings', ['request_timeout', 'page_size', 'pool_size',
+                                                     'connection_retries', 'rate_limit_fraction',
+                                                     'max_concurrent_streams', 'backfill_slices',
+                                                     'multiplex_metric_streams', 'prefetch_pages',
+                                                     'async_engine', 'streaming_parse', 'json_backend',
+                                                     'output_buffer_size', 'output_flush_interval',
+                                                     'state_emit_interval_pages',
+                                                     'state_emit_interval_seconds',
+                                                     'max_concurrent_params_sets',
+                                                     'single_suppression_query'])):
+    """
+    Settings resolved once from the tap config in `main()`.
+    The request path only reads this object and never parses argv or config files.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_config(cls, config):
+        max_concurrent_streams = get_positive_int(config, 'max_concurrent_streams', 1)
+        backfill_slices = get_positive_int(config, 'backfill_slices', 1)
+        max_concurrent_params_sets = get_positive_int(config, 'max_concurrent_params_sets', 1)
+        return cls(
+            request_timeout=get_request_timeout(config),
+            page_size=get_positive_int(config, 'page_size', None),
+            # Every concurrent stream, backfill slice and params set needs its own connection
+            pool_size=max(get_positive_int(config, 'pool_size', POOL_SIZE),
+                          max_concurrent_streams * max(backfill_slices, max_concurrent_params_sets)),
+            connection_retries=get_non_negative_int(config, 'connection_retries', CONNECTION_RETRIES),
+            rate_limit_fraction=get_rate_limit_fraction(config),
+            max_concurrent_streams=max_concurrent_streams,
+            backfill_slices=backfill_slices,
+            multiplex_metric_streams=get_boolean(config, 'multiplex_metric_streams'),
+            prefetch_pages=get_positive_int(config, 'prefetch_pages', 0),
+            async_engine=get_boolean(config, 'async_engine'),
+            streaming_parse=get_boolean(config, 'streaming_parse'),
+            json_backend=config.get('json_backend') or 'auto',
+            output_buffer_size=get_positive_int(config, 'output_buffer_size', OUTPUT_BUFFER_SIZE),
+            output_flush_interval=get_positive_float(config, 'output_flush_interval', OUTPUT_FLUSH_INTERVAL),
+            state_emit_interval_pages=get_positive_int(config, 'state_emit_interval_pages', None),
+            state_emit_interval_seconds=get_positive_float(config, 'state_emit_interval_seconds', None),
+            max_concurrent_params_sets=max_concurrent_params_sets,
+            single_suppression_query=get_boolean(config, 'single_suppression_query'))
+
+
+runtime_settings = RuntimeSettings.from_config({})
+rate_limiter = RateLimiter()
+json_codec = get_codec()
+output_buffer = MessageBuffer()
+# Set when a stream fails so the streams synced concurrently stop at their next page
+sync_stopped = threading.Event()
+# Record transformers of the synced streams, by id of the catalog stream
+compiled_transformers = {}
+transformers_lock = threading.Lock()
+
+
+def get_runtime_settings():
+    return runtime_settings
+
+
+def get_rate_limiter():
+    return rate_limiter
+
+
+def get_json_codec():
+    return json_codec
+
+
+def set_runtime_settings(settings):
+    """Install the settings used by the HTTP layer, the shared session and rate limiter are built from them."""
+    global runtime_settings, session, rate_limiter, json_codec, output_buffer
+    runtime_settings = settings
+    session.close()
+    session = build_session(pool_size=settings.pool_size,
+                            connection_retries=settings.connection_retries)
+    rate_limiter = RateLimiter(fraction=settings.rate_limit_fraction)
+    json_codec = get_codec(settings.json_backend)
+    with output_lock:
+        output_buffer.flush()
+        output_buffer = MessageBuffer(settings.output_buffer_size, settings.output_flush_interval)
+    if settings.streaming_parse and ijson is None:
+        logger.warning("streaming_parse requires ijson, pages are decoded at once instead")
+    return settings
+
+
+def is_streaming_parse_enabled():
+    return runtime_settings.streaming_parse and ijson is not None
+
+
+def get_page_size_params(stream_name):
+    # Only send `page[size]` for the endpoints which support it
+    if runtime_settings.page_size and stream_name in MAX_PAGE_SIZE:
+        return {"page[size]": min(runtime_settings.page_size, MAX_PAGE_SIZE[stream_name])}
+    return {}
+
+
+def get_connection_stats():
+    """Return the number of requests sent and connections opened by the shared session."""
+    stats = {'requests': 0, 'new_connections': 0}
+    for adapter in set(session.adapters.values()):
+        if not isinstance(adapter, HTTPAdapter):
+            continue
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats['requests'] += pool.num_requests
+            stats['new_connections'] += pool.num_connections
+    stats['reused_connections'] = max(stats['requests'] - stats['new_connections'], 0)
+    return stats
+
+
+def log_connection_stats():
+    stats = get_connection_stats()
+    logger.info("HTTP connections: %s requests, %s new connections, %s reused connections",
+                stats['requests'], stats['new_connections'], stats['reused_connections'])
+
+# Attributes and relationships of the events which are mapped to the fields of the event streams
+EVENT_ATTRIBUTES = ("timestamp", "event_properties", "datetime", "uuid")
+EVENT_RELATIONSHIPS = ("profile", "metric")
+# Relationships which are attached to the records locally instead of being included in the responses
+LOCAL_RELATIONSHIPS = ("metric",)
+
+# Flattened metrics by id, loaded once per run
+metric_cache = {}
+metric_cache_lock = threading.Lock()
+
 STREAM_PARAMS_MAP = {
     "campaigns": [
         {
@@ -47,12 +282,25 @@ STREAM_PARAMS_MAP = {
 
 }
 
+# Suppression reasons of the `global_exclusions` params sets, queried at once by `single_suppression_query`
+SUPPRESSION_REASONS = ("HARD_BOUNCE", "USER_SUPPRESSED", "UNSUBSCRIBE", "INVALID_EMAIL")
+
+# Attribute filtered with `greater-than` when a full table stream is synced incrementally
+INCREMENTAL_REPLICATION_KEYS = {
+    "global_exclusions": "updated",
+    "campaigns": "updated_at",
+    "lists": "updated",
+}
+
 class KlaviyoError(Exception):
     pass
 
 class KlaviyoBackoffError(KlaviyoError):
     pass
 
+class KlaviyoSyncStoppedError(KlaviyoError):
+    pass
+
 class KlaviyoNotFoundError(KlaviyoError):
     pass
 
@@ -69,7 +317,8 @@ class KlaviyoConflictError(KlaviyoError):
     pass
 
 class KlaviyoRateLimitError(KlaviyoBackoffError):
-    pass
+    # Seconds to wait as sent by Klaviyo in the `Retry-After` header
+    retry_after = None
 
 class KlaviyoInternalServiceError(KlaviyoBackoffError):
     pass
@@ -140,7 +389,7 @@ ERROR_CODE_EXCEPTION_MAPPING = {
     },
 }
 
-def raise_for_error(response):   
+def raise_for_error(response, retry_after=None):
     try:
         response.raise_for_status()
     except requests.HTTPError:
@@ -149,11 +398,17 @@ def raise_for_error(response):
         except (ValueError, TypeError, IndexError, KeyError):
             json_resp = {}
 
-        error_code = response.status_code
-        message_text = json_resp.get("message", ERROR_CODE_EXCEPTION_MAPPING.get(error_code, {}).get("message", "Unknown Error"))
-        message = "HTTP-error-code: {}, Error: {}".format(error_code, message_text)
-        exc = ERROR_CODE_EXCEPTION_MAPPING.get(error_code, {}).get("raise_exception", KlaviyoError)
-        raise exc(message) from None
+        raise get_error(response.status_code, json_resp, retry_after) from None
+
+def get_error(error_code, json_resp, retry_after=None):
+    """Map an HTTP error code and the error body to a `KlaviyoError`."""
+    message_text = json_resp.get("message", ERROR_CODE_EXCEPTION_MAPPING.get(error_code, {}).get("message", "Unknown Error"))
+    message = "HTTP-error-code: {}, Error: {}".format(error_code, message_text)
+    exc = ERROR_CODE_EXCEPTION_MAPPING.get(error_code, {}).get("raise_exception", KlaviyoError)
+    error = exc(message)
+    if isinstance(error, KlaviyoRateLimitError):
+        error.retry_after = retry_after
+    return error
 
 def dt_to_ts(dt):
     return int(time.mktime(datetime.datetime.strptime(
@@ -176,6 +431,9 @@ def update_state(state, entity, dt):
         st.set_bookmark(state, entity, 'since', dt)
 
     if dt >= st.get_bookmark(state, entity, 'since'):
+        if dt != st.get_bookmark(state, entity, 'since'):
+            # The boundary ids of the previous bookmark are older than the new one
+            state['bookmarks'][entity].pop('boundary_ids', None)
         st.set_bookmark(state, entity, 'since', dt)
 
     logger.info("Replicated %s up to %s", entity, state['bookmarks'][entity])
@@ -197,113 +455,898 @@ def get_starting_point(stream, state, start_date):
 def get_latest_event_time(events):
     return ts_to_dt(int(events[-1]['timestamp']) - 1) if len(events) else None
 
+class BoundaryIds(object):
+    """
+    The next sync starts from the second of the bookmark, so it reads the last events of this
+    one again. The ids of the events at or after the bookmark are kept in the state and these
+    events are skipped by the next sync. When there are more than MAX_BOUNDARY_IDS of them,
+    no ids are kept and they are written again.
+    """
+
+    def __init__(self, state, entity):
+        self.skipped_ids = set((state.get('bookmarks', {}).get(entity) or {}).get('boundary_ids') or [])
+        # (timestamp, id) of the events read at or after the bookmark
+        self.events = []
+
+    def skip(self, events):
+        """Return the events which were not written by the previous sync."""
+        if not self.skipped_ids:
+            return events
+        return [event for event in events if event['id'] not in self.skipped_ids]
+
+    def filter(self, events):
+        """Same as `skip`, the events are also tracked to build the ids of the next bookmark."""
+        self.events.extend((int(event['attributes']['timestamp']), event['id']) for event in events)
+        return self.skip(events)
+
+    def update_state(self, state, entity):
+        since = st.get_bookmark(state, entity, 'since')
+        if since is None:
+            return
+        since_ts = dt_to_ts(since)
+        self.events = [(timestamp, event_id) for timestamp, event_id in self.events if timestamp >= since_ts]
+        if len(self.events) > MAX_BOUNDARY_IDS:
+            state['bookmarks'][entity].pop('boundary_ids', None)
+        else:
+            st.set_bookmark(state, entity, 'boundary_ids', sorted(event_id for _, event_id in self.events))
+
+
+class Page(object):
+    """
+    A single page returned by the Klaviyo API.
+    The body is decoded once in `authed_get` and the raw response is not kept around.
+    """
+    __slots__ = ('body', 'status_code', 'elapsed', 'next_url')
+
+    def __init__(self, body, status_code=200, elapsed=0.0):
+        self.body = body
+        self.status_code = status_code
+        # Seconds spent requesting and decoding the page
+        self.elapsed = elapsed
+        self.next_url = (body.get('links') or {}).get('next')
+
+    @property
+    def data(self):
+        return self.body.get('data')
+
+    @property
+    def included(self):
+        return self.body.get('included') or []
+
+    def index_included(self):
+        # Creating a dict/map of the flattened included relationships by (type, id)
+        return {get_included_key(included_relationship): flatten_included(included_relationship)
+                for included_relationship in self.included}
+
+
+def get_included_key(included_relationship):
+    return included_relationship.get('type'), included_relationship['id']
+
+
+def flatten_included(included_relationship):
+    """
+    Flatten an included object with its attributes. It is flattened once per page and shared by
+    reference by every event of the page which relates to it.
+    """
+    flattened = dict(included_relationship)
+    flattened.update(included_relationship.get('attributes') or {})
+    return flattened
+
+
+def retry_after_expo():
+    """
+    Exponential wait generator for `backoff` which does not wait when Klaviyo sent `Retry-After`,
+    the rate limiter already holds the next request of the endpoint until then.
+    """
+    expo = backoff.expo()
+    next(expo)
+    exception = yield
+    while True:
+        if isinstance(exception, KlaviyoRateLimitError) and exception.retry_after is not None:
+            exception = yield 0
+        else:
+            exception = yield next(expo)
+
 # during 'Timeout' error there is also possibility of 'ConnectionError',
 # hence added backoff for 'ConnectionError' too.
 @backoff.on_exception(backoff.expo, (requests.Timeout, requests.ConnectionError), max_tries=5, factor=2)
-@backoff.on_exception(backoff.expo, (simplejson.scanner.JSONDecodeError, KlaviyoBackoffError), max_tries=3)
-def authed_get(source, url, params, headers):
+@backoff.on_exception(retry_after_expo, (simplejson.scanner.JSONDecodeError, KlaviyoBackoffError), max_tries=3)
+def authed_get(source, url, params, headers, streamed=False):
+    # Wait for the endpoint budget before sending, so the request does not hit a 429
+    rate_limiter.acquire(url)
+    # A streamed body is parsed while it is read from the socket by `StreamedPage`
+    request_kwargs = {'stream': True} if streamed else {}
     with metrics.http_request_timer(source) as timer:
-        resp = requests.get(url=url, params=params, headers=headers, timeout=get_request_timeout())
-        
+        start_time = time.monotonic()
+        resp = session.request(method='get', url=url, params=params, headers=headers,
+                               timeout=runtime_settings.request_timeout, **request_kwargs)
+        retry_after = rate_limiter.record(url, resp.status_code, resp.headers)
+
         if resp.status_code != 200:
-            raise_for_error(resp)
+            raise_for_error(resp, retry_after)
+        elif streamed:
+            resp.raw.decode_content = True
+            timer.tags[metrics.Tag.http_status_code] = resp.status_code
+            return StreamedPage(resp, resp.status_code, time.monotonic() - start_time, url, params)
         else:
-            resp.json()
+            body = json_codec.decode_response(resp)
             timer.tags[metrics.Tag.http_status_code] = resp.status_code
-            return resp
+            return Page(body, resp.status_code, time.monotonic() - start_time)
+
+def get_all_using_next(stream, url, headers, params, streamed=False):
+    # The next url of a streamed page is only known once the page has been consumed
+    if runtime_settings.prefetch_pages and not streamed:
+        return get_all_using_next_prefetched(stream, url, headers, params, runtime_settings.prefetch_pages)
+    return get_pages(stream, url, headers, params, streamed)
 
-def get_all_using_next(stream, url, headers, params):
+def get_pages(stream, url, headers, params, streamed=False):
     # Paginate till there is a url or next url.
     while url:
-        r = authed_get(stream, url, params, headers)
+        if sync_stopped.is_set():
+            # The stream did not complete, its bookmark stays at its last written page
+            raise KlaviyoSyncStoppedError(f"The sync of {stream} was stopped by the failure of another stream")
+        page = authed_get(stream, url, params, headers, streamed=streamed)
         # Re-initializing params to {} as next url contains all necessary params.
         params = {}
-        yield r
-        url = r.json()['links'].get('next', None)
+        yield page
+        url = page.next_url
+
+def get_all_using_next_prefetched(stream, url, headers, params, depth):
+    """
+    Paginate in a background thread which fetches up to `depth` pages ahead,
+    so the next page is requested while the current one is transformed and written.
+    """
+    pages = queue.Queue(maxsize=depth)
+    # Set when the consumer stops early or fails, the fetching thread then stops paginating
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fetch():
+        try:
+            for page in get_pages(stream, url, headers, params):
+                if not put((page, None)):
+                    return
+            put((None, None))
+        except Exception as exc: # pylint: disable=broad-except
+            put((None, exc))
+
+    fetcher = threading.Thread(target=fetch, name=f"prefetch-{stream}", daemon=True)
+    fetcher.start()
+    try:
+        while True:
+            page, exc = pages.get()
+            if exc is not None:
+                raise exc
+            if page is None:
+                return
+            yield page
+    finally:
+        stop.set()
+
+def is_field_selected(mdata, field_name):
+    # Same rule as `Transformer.filter_data_by_metadata`, fields are kept unless deselected or unsupported
+    breadcrumb = ('properties', field_name)
+    if metadata.get(mdata, breadcrumb, 'inclusion') == 'automatic':
+        return True
+    return metadata.get(mdata, breadcrumb, 'selected') is not False and \
+        metadata.get(mdata, breadcrumb, 'inclusion') != 'unsupported'
+
+
+def get_event_fieldsets(streams):
+    """
+    Build the `include` and sparse `fields[...]` params of an events request from the fields
+    selected in the catalog. A relationship is only included when it is selected in one of the streams.
+    """
+    selected_fields = get_selected_fields(streams)
+
+    params = {"fields[event]": ",".join(field_name for field_name in EVENT_ATTRIBUTES
+                                        if field_name in selected_fields)}
+    include = []
+    for relationship in EVENT_RELATIONSHIPS:
+        if relationship not in selected_fields or relationship in LOCAL_RELATIONSHIPS:
+            continue
+        include.append(relationship)
+        params[f"fields[{relationship}]"] = get_relationship_fields(streams[0], relationship)
+    if include:
+        params["include"] = ",".join(include)
+    return params
+
+
+def get_selected_fields(streams):
+    selected_fields = set()
+    for stream in streams:
+        mdata = metadata.to_map(stream['metadata'])
+        selected_fields.update(field_name for field_name in stream['schema']['properties']
+                               if is_field_selected(mdata, field_name))
+    return selected_fields
+
+
+def get_relationship_fields(stream, relationship):
+    # Every relationship attribute in the schema, `type` and `id` are always returned
+    item_properties = stream['schema']['properties'][relationship]['items']['properties']
+    return ",".join(field_name for field_name in item_properties if field_name not in ('type', 'id'))
+
+
+def get_event_relationships(streams):
+    """Relationships resolved in the records of the event streams, included or attached locally."""
+    selected_fields = get_selected_fields(streams)
+    return [relationship for relationship in EVENT_RELATIONSHIPS if relationship in selected_fields]
+
+
+def cache_metric(metric):
+    """Flatten a metric like an included object and keep it for the rest of the run."""
+    flattened = dict(metric)
+    flattened.update(metric.get('attributes') or {})
+    with metric_cache_lock:
+        metric_cache[metric['id']] = flattened
+    return flattened
+
+
+def get_cached_metric(metric_id):
+    with metric_cache_lock:
+        return metric_cache.get(metric_id)
+
+
+def get_metric_request(endpoint, stream):
+    # The metrics endpoint is a sibling of the events endpoint
+    url = urljoin(endpoint, f"metrics/{stream['tap_stream_id']}")
+    return url, {"fields[metric]": get_relationship_fields(stream, 'metric')}
+
+
+def get_metric(endpoint, stream, headers):
+    metric = get_cached_metric(stream['tap_stream_id'])
+    if metric is None:
+        url, params = get_metric_request(endpoint, stream)
+        try:
+            metric = cache_metric(authed_get('metric', url, params, headers).data)
+        except KlaviyoNotFoundError:
+            # Left unresolved like a relationship missing from `included`
+            logger.warning("Metric %s was not found, the metric of the %s records is not resolved",
+                           stream['tap_stream_id'], stream['stream'])
+    return metric
+
+
+class LocalIncluded(object):
+    """
+    The included map entries of the relationships attached locally. Every event of a metric stream
+    relates to the same metric, so it is loaded once per run instead of being included in every page.
+    It is only requested with the first page which has events of the stream, a stream without new
+    events costs no request to the metrics endpoint.
+    """
+
+    def __init__(self, streams, endpoint, headers):
+        self.streams_by_metric_id = {stream['tap_stream_id']: stream for stream in streams}
+        self.endpoint = endpoint
+        self.headers = headers
+        self.resolve_metric = 'metric' in get_event_relationships(streams)
+        self.included = {}
+        self.loaded = set()
+        # Shared by the slices of a backfill
+        self.lock = threading.Lock()
+
+    def get(self, metric_ids=None):
+        """The entries of the streams with events, `metric_ids` or every stream, loaded on the first call."""
+        if not self.resolve_metric:
+            return self.included
+        with self.lock:
+            for metric_id in metric_ids or self.streams_by_metric_id:
+                if metric_id in self.loaded:
+                    continue
+                metric = get_metric(self.endpoint, self.streams_by_metric_id[metric_id], self.headers)
+                if metric is not None:
+                    self.included[('metric', metric_id)] = metric
+                # A metric which was not found is not requested again
+                self.loaded.add(metric_id)
+            return self.included
+
+
+def get_event_params(stream, start_ts, end_ts=None):
+    event_filter = f"equals(metric_id,\"{stream['tap_stream_id']}\"),greater-or-equal(timestamp,{start_ts})"
+    if end_ts is not None:
+        event_filter += f",less-than(timestamp,{end_ts})"
+    return {
+        "filter": event_filter,
+        **get_event_fieldsets([stream]),
+        "sort": "datetime"
+    }
+
+
+def get_backfill_slices(start_ts, end_ts, slice_count):
+    """
+    Split [start_ts, end_ts) into at most `slice_count` consecutive ranges of at least a day.
+    The last range is left open ended so it also returns the events created during the sync.
+    """
+    slice_count = max(min(slice_count, (end_ts - start_ts) // MIN_BACKFILL_SLICE_SECONDS), 1)
+    step = (end_ts - start_ts) // slice_count
+    bounds = [start_ts + index * step for index in range(slice_count)] + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+class BackfillProgress:
+    """
+    Tracks the slices of a backfill. The events of a slice are sorted by datetime, but slices
+    complete in any order, so the bookmark only advances through the contiguous completed prefix.
+    """
+
+    def __init__(self, slices):
+        self.slices = slices
+        self.completed = [False] * len(slices)
+        self.latest_event_ts = [None] * len(slices)
+
+    def update(self, index, events):
+        self.latest_event_ts[index] = int(events[-1]['timestamp'])
+
+    def complete(self, index):
+        self.completed[index] = True
+
+    def get_bookmark(self):
+        bookmark = None
+        for (_, end_ts), completed, latest_event_ts in zip(self.slices, self.completed, self.latest_event_ts):
+            if completed and end_ts is not None:
+                # Every event before the end of a completed slice has been written
+                bookmark = end_ts
+                continue
+            if latest_event_ts is not None:
+                # Same as `get_latest_event_time`, events of the last second may not be complete yet
+                bookmark = latest_event_ts - 1
+            break
+        return bookmark
+
 
 def get_incremental_pull(stream, endpoint, state, headers, start_date):
     latest_event_time = get_starting_point(stream, state, start_date)
 
-    with metrics.record_counter(stream['stream']) as counter:
-        params = {
-            "filter": f"equals(metric_id,\"{stream['tap_stream_id']}\"),greater-or-equal(timestamp,{latest_event_time})",
-            "include": "profile,metric",
-            "sort": "datetime"
-        }
-        for response in get_all_using_next(stream['stream'], endpoint, headers, params):
-            events = response.json().get('data')
+    if latest_event_time is not None and runtime_settings.backfill_slices > 1:
+        slices = get_backfill_slices(latest_event_time, int(time.time()), runtime_settings.backfill_slices)
+        if len(slices) > 1:
+            return get_sliced_incremental_pull(stream, endpoint, state, headers, slices)
+
+    if is_streaming_parse_enabled():
+        return get_streamed_incremental_pull(stream, endpoint, state, headers, latest_event_time)
+
+    with metrics.record_counter(stream['stream']) as counter, StateCheckpoint(state) as checkpoint:
+        params = get_event_params(stream, latest_event_time)
+        valid_relationships = get_event_relationships([stream])
+        local_included = LocalIncluded([stream], endpoint, headers)
+        boundary_ids = BoundaryIds(state, stream['tap_stream_id'])
+        for page in get_all_using_next(stream['stream'], endpoint, headers, params):
+            events = boundary_ids.filter(page.data or [])
 
             if events:
-                included_list = response.json().get('included', [])
-                # Creating a dict/map of included relationships to optimize computations
-                included = {}
-                for included_relationship in included_list:
-                    included[included_relationship['id']] = included_relationship
                 counter.increment(len(events))
-                transfrom_and_write_records(events, stream, included, params.get("include","").split(","))
-                update_state(state, stream['tap_stream_id'], get_latest_event_time(events))
-                singer.write_state(state)
+                transfrom_and_write_records(events, stream, {**page.index_included(), **local_included.get()},
+                                            valid_relationships)
+                # The state is shared by concurrently synced streams
+                with output_lock:
+                    update_state(state, stream['tap_stream_id'], get_latest_event_time(events))
+                    boundary_ids.update_state(state, stream['tap_stream_id'])
+                    checkpoint.page_done()
 
     return state
 
-def get_full_pulls(resource, endpoint, headers):
 
-    with metrics.record_counter(resource['stream']) as counter:
-        for params in STREAM_PARAMS_MAP.get(resource['stream'],[]):
-            for response in get_all_using_next(resource['stream'], endpoint, headers, params):
-                records = response.json().get('data')
-                included_list = response.json().get('included', [])
-                # Creating a dict/map of included relationships to optimize computations
-                included = {}
-                for included_relationship in included_list:
-                    included[included_relationship['id']] = included_relationship
-                counter.increment(len(records))
-                transfrom_and_write_records(records, resource, included, params.get("include","").split(","))
+def get_streamed_incremental_pull(stream, endpoint, state, headers, latest_event_time):
+    """Same as `get_incremental_pull`, the records are written while every page is still being read."""
+    with metrics.record_counter(stream['stream']) as counter, StateCheckpoint(state) as checkpoint:
+        params = get_event_params(stream, latest_event_time)
+        valid_relationships = get_event_relationships([stream])
+        local_included = LocalIncluded([stream], endpoint, headers)
+        boundary_ids = BoundaryIds(state, stream['tap_stream_id'])
+        for page in get_all_using_next(stream['stream'], endpoint, headers, params, streamed=True):
+            latest_timestamp = 0
+            # The metric is loaded with the first events, the records of that page wait for it until
+            # the page has been read and are resolved from the batch `included` before being written
+            for events, included in get_streamed_batches(stream['stream'], page, headers, valid_relationships,
+                                                         local_included.included):
+                events = boundary_ids.filter(events)
+                if not events:
+                    continue
+                included.update(local_included.get())
+                counter.increment(len(events))
+                transfrom_and_write_records(events, stream, included, valid_relationships)
+                # Records waiting for their relationships are written later, so they may be out of order
+                latest_timestamp = max(latest_timestamp, *(int(event['timestamp']) for event in events))
+
+            if latest_timestamp:
+                with output_lock:
+                    # Decreased by 1 second like `get_latest_event_time`
+                    update_state(state, stream['tap_stream_id'], ts_to_dt(latest_timestamp - 1))
+                    boundary_ids.update_state(state, stream['tap_stream_id'])
+                    checkpoint.page_done()
+
+    return state
+
+
+def get_sliced_incremental_pull(stream, endpoint, state, headers, slices):
+    """Backfill an event stream by paging every time slice independently and in parallel."""
+    progress = BackfillProgress(slices)
+    # Set when a slice fails so the other slices stop paging
+    stop = threading.Event()
+    logger.info("Backfilling %s in %s time slices", stream['stream'], len(slices))
+
+    checkpoint = StateCheckpoint(state)
+
+    def write_bookmark():
+        with output_lock:
+            update_state(state, stream['tap_stream_id'], progress.get_bookmark())
+            checkpoint.page_done()
+
+    valid_relationships = get_event_relationships([stream])
+    local_included = LocalIncluded([stream], endpoint, headers)
+    # The events of the previous sync are skipped, the slices do not keep boundary ids for the next one
+    boundary_ids = BoundaryIds(state, stream['tap_stream_id'])
+
+    def sync_slice(index, start_ts, end_ts, counter):
+        params = get_event_params(stream, start_ts, end_ts)
+        for page in get_all_using_next(stream['stream'], endpoint, headers, params):
+            if stop.is_set():
+                return
+            events = boundary_ids.skip(page.data or [])
+
+            if events:
+                transfrom_and_write_records(events, stream, {**page.index_included(), **local_included.get()},
+                                            valid_relationships)
+                with output_lock:
+                    counter.increment(len(events))
+                    progress.update(index, events)
+                write_bookmark()
+
+        with output_lock:
+            progress.complete(index)
+        write_bookmark()
+
+    with metrics.record_counter(stream['stream']) as counter, checkpoint:
+        with ThreadPoolExecutor(max_workers=len(slices)) as executor:
+            futures = [executor.submit(sync_slice, index, start_ts, end_ts, counter)
+                       for index, (start_ts, end_ts) in enumerate(slices)]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in done:
+                if future.exception() is not None:
+                    stop.set()
+                    raise future.exception()
+
+    return state
+
+def get_event_metric_id(event):
+    return ((event.get('relationships') or {}).get('metric') or {}).get('data', {}).get('id')
+
+
+def get_multiplexed_incremental_pull(streams, endpoint, state, headers, start_date):
+    """
+    Sync several metric streams with a single events query starting from the oldest of their
+    bookmarks. Events are routed to their stream by metric id and every stream keeps its own bookmark.
+    """
+    streams_by_metric_id = {stream['tap_stream_id']: stream for stream in streams}
+    starting_points = {metric_id: get_starting_point(stream, state, start_date)
+                       for metric_id, stream in streams_by_metric_id.items()}
+    metric_ids = ",".join(f"\"{metric_id}\"" for metric_id in streams_by_metric_id)
+    params = {
+        "filter": f"any(metric_id,[{metric_ids}]),greater-or-equal(timestamp,{min(starting_points.values())})",
+        **get_event_fieldsets(streams),
+        "sort": "datetime"
+    }
+    valid_relationships = get_event_relationships(streams)
+    local_included = LocalIncluded(streams, endpoint, headers)
+    boundary_ids = {metric_id: BoundaryIds(state, metric_id) for metric_id in streams_by_metric_id}
+    logger.info("Syncing %s with a single events query", ", ".join(stream['stream'] for stream in streams))
+
+    with ExitStack() as stack:
+        counters = {metric_id: stack.enter_context(metrics.record_counter(stream['stream']))
+                    for metric_id, stream in streams_by_metric_id.items()}
+        checkpoint = stack.enter_context(StateCheckpoint(state))
+        for page in get_all_using_next('events', endpoint, headers, params):
+            events_by_metric_id = defaultdict(list)
+            for event in page.data or []:
+                metric_id = get_event_metric_id(event)
+                # Skip the events before the bookmark of their own stream
+                if metric_id in starting_points and event['attributes']['timestamp'] >= starting_points[metric_id]:
+                    events_by_metric_id[metric_id].append(event)
+
+            events_by_metric_id = {metric_id: boundary_ids[metric_id].filter(events)
+                                   for metric_id, events in events_by_metric_id.items()}
+            events_by_metric_id = {metric_id: events for metric_id, events in events_by_metric_id.items() if events}
+            if not events_by_metric_id:
+                continue
+            included = {**page.index_included(), **local_included.get(events_by_metric_id)}
+            for metric_id, events in events_by_metric_id.items():
+                counters[metric_id].increment(len(events))
+                transfrom_and_write_records(events, streams_by_metric_id[metric_id], included,
+                                            valid_relationships)
+            with output_lock:
+                for metric_id, events in events_by_metric_id.items():
+                    update_state(state, metric_id, get_latest_event_time(events))
+                    boundary_ids[metric_id].update_state(state, metric_id)
+                checkpoint.page_done()
+
+    return state
+
+class FullTableCheckpoint(object):
+    """
+    Position of a full table sync kept in the bookmark of the stream: the table version, the
+    indexes of the completed params sets and the `links.next` url of the next page of the others.
+    A restarted sync resumes from there with the same version, the position is cleared once the
+    stream is complete and ACTIVATE_VERSION is written. No ACTIVATE_VERSION is written before the
+    records: a connection synced before the bookmark existed cannot be told apart from a new
+    table, and activating an empty version would hide its rows until the sync completes.
+    """
+
+    def __init__(self, state, stream, params_count):
+        self.state = state
+        self.stream_name = stream['stream']
+        self.stream_id = stream['tap_stream_id']
+        self.params_count = params_count
+        bookmark = state.setdefault('bookmarks', {}).get(self.stream_id) or {}
+        # The saved positions are only valid for the same params sets, see `single_suppression_query`
+        if bookmark.get('version') and 'next_urls' in bookmark and bookmark.get('params_count') == params_count:
+            self.version = bookmark['version']
+            self.completed = set(bookmark.get('completed_params') or [])
+            # by params set index, as a string once the state has been serialized
+            self.next_urls = dict(bookmark['next_urls'])
+            logger.info("Resuming %s, params sets %s are complete", self.stream_name, sorted(self.completed))
+        else:
+            self.version = int(time.time() * 1000)
+            self.completed = set()
+            self.next_urls = {}
+
+    def start(self):
+        with output_lock:
+            self.save()
+
+    def save(self):
+        # The `since` of the incremental syncs of the stream is kept
+        bookmark = self.state['bookmarks'].setdefault(self.stream_id, {})
+        bookmark.update({
+            'version': self.version,
+            'params_count': self.params_count,
+            'completed_params': sorted(self.completed),
+            'next_urls': dict(self.next_urls),
+        })
+
+    def is_complete(self, params_index):
+        return params_index in self.completed
+
+    def get_request(self, params_index, endpoint, params):
+        """The url and params of the first request of a params set, its saved next page when resuming it."""
+        next_url = self.next_urls.get(str(params_index))
+        if next_url:
+            return next_url, {}
+        return endpoint, params
+
+    def page_done(self, params_index, next_url):
+        with output_lock:
+            if next_url:
+                self.next_urls[str(params_index)] = next_url
+            else:
+                self.next_urls.pop(str(params_index), None)
+                self.completed.add(params_index)
+            self.save()
+
+    def complete(self):
+        with output_lock:
+            write_activate_version(self.stream_name, self.version)
+            bookmark = self.state['bookmarks'][self.stream_id]
+            bookmark.pop('params_count', None)
+            bookmark.pop('completed_params', None)
+            bookmark.pop('next_urls', None)
+
+
+def get_resumed_pages(stream, url, headers, params, endpoint, endpoint_params, streamed=False):
+    """
+    Paginate from `url`. When it is the saved next page of an interrupted sync and Klaviyo
+    rejects it, e.g. an expired cursor, the params set is paged again from its first page.
+    """
+    pages = get_all_using_next(stream, url, headers, params, streamed)
+    if url == endpoint:
+        yield from pages
+        return
+    try:
+        first_page = next(pages)
+    except StopIteration:
+        return
+    except KlaviyoBadRequestError:
+        logger.warning("Could not resume %s from its saved page, restarting its params set", stream)
+        yield from get_all_using_next(stream, endpoint, headers, endpoint_params, streamed)
+        return
+    yield first_page
+    yield from pages
+
+
+def get_full_pulls(resource, endpoint, headers, state):
+    """
+    Page every params set of a full table stream, up to `max_concurrent_params_sets` of them in
+    parallel. They share the rate limiter and their records are written to the same stream.
+    """
+    stream_params = get_stream_params(resource['stream'])
+    checkpoint = FullTableCheckpoint(state, resource, len(stream_params))
+    streamed = is_streaming_parse_enabled()
+    # Set when a params set fails so the others stop paging
+    stop = threading.Event()
+    state_checkpoint = StateCheckpoint(state)
+
+    def sync_params_set(params_index, params, counter):
+        params = {**params, **get_page_size_params(resource['stream'])}
+        valid_relationships = params.get("include","").split(",")
+        url, request_params = checkpoint.get_request(params_index, endpoint, params)
+        for page in get_resumed_pages(resource['stream'], url, headers, request_params,
+                                      endpoint, params, streamed):
+            if stop.is_set():
+                return
+            for records, included in get_page_batches(resource['stream'], page, headers, valid_relationships,
+                                                      streamed):
+                records = select_records(resource['stream'], records)
+                with output_lock:
+                    counter.increment(len(records))
+                transfrom_and_write_records(records, resource, included, valid_relationships,
+                                            checkpoint.version)
+            checkpoint.page_done(params_index, page.next_url)
+            state_checkpoint.page_done()
 
+    # The params sets completed before the sync was restarted are skipped
+    params_sets = [(params_index, params)
+                   for params_index, params in enumerate(stream_params)
+                   if not checkpoint.is_complete(params_index)]
+    max_workers = min(runtime_settings.max_concurrent_params_sets, len(params_sets))
 
-def transfrom_and_write_records(events, stream, included, valid_relationships):
+    with metrics.record_counter(resource['stream']) as counter, state_checkpoint:
+        checkpoint.start()
+        if max_workers <= 1:
+            for params_index, params in params_sets:
+                sync_params_set(params_index, params, counter)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(sync_params_set, params_index, params, counter)
+                           for params_index, params in params_sets]
+                done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+                for future in done:
+                    if future.exception() is not None:
+                        stop.set()
+                        raise future.exception()
+        checkpoint.complete()
+        state_checkpoint.write()
+
+
+def get_page_batches(stream, page, headers, valid_relationships, streamed=False):
+    """The records of a page with the included objects to resolve them, in batches for a streamed page."""
+    if streamed:
+        return get_streamed_batches(stream, page, headers, valid_relationships)
+    return [(page.data, page.index_included())]
+
+
+def get_streamed_batches(stream, page, headers, valid_relationships, known_included=None):
+    """
+    `StreamedPage.iter_batches`, the page is requested again when reading its body fails like
+    `authed_get` retries a body read at once. The records of the page which were already
+    written are written again.
+    """
+    for attempt in range(1, STREAMED_PAGE_TRIES + 1):
+        try:
+            yield from page.iter_batches(valid_relationships, flatten_included, known_included)
+            return
+        except (requests.ConnectionError, simplejson.scanner.JSONDecodeError) as e:
+            if attempt == STREAMED_PAGE_TRIES:
+                raise
+            logger.warning("Reading a page of %s failed (%s), requesting it again", stream, e)
+            page.reload(authed_get(stream, page.url, page.params, headers, streamed=True).response)
+
+
+def get_stream_params(stream_name):
+    """The params sets paged for a full table stream."""
+    if stream_name == 'global_exclusions' and runtime_settings.single_suppression_query:
+        reasons = ",".join(f"'{reason}'" for reason in SUPPRESSION_REASONS)
+        return [{
+            "filter": f"any(subscriptions.email.marketing.suppression.reason,[{reasons}])",
+            "additional-fields[profile]": "subscriptions,predictive_analytics"
+        }]
+    return STREAM_PARAMS_MAP.get(stream_name, [])
+
+
+def get_suppression_reasons(profile):
+    """The reasons of SUPPRESSION_REASONS a profile is suppressed from email marketing for."""
+    subscriptions = (profile.get('attributes') or {}).get('subscriptions') or {}
+    marketing = (subscriptions.get('email') or {}).get('marketing') or {}
+    return {suppression.get('reason') for suppression in marketing.get('suppression') or []
+            if isinstance(suppression, dict)} & set(SUPPRESSION_REASONS)
+
+
+def select_records(stream_name, records):
+    """
+    The profiles of the single suppression query are classified locally, the ones which are not
+    suppressed for any of SUPPRESSION_REASONS would not be returned by the per reason queries.
+    """
+    if stream_name == 'global_exclusions' and runtime_settings.single_suppression_query:
+        return [record for record in records if get_suppression_reasons(record)]
+    return records
+
+
+def get_replication_method(stream):
+    """The replication method chosen in the catalog, full table streams may also be synced incrementally."""
+    mdata = metadata.to_map(stream['metadata'])
+    return metadata.get(mdata, (), 'replication-method') or \
+        metadata.get(mdata, (), 'forced-replication-method') or 'FULL_TABLE'
+
+
+def get_updated_since(stream, state, start_date):
+    since = (state.get('bookmarks', {}).get(stream['tap_stream_id']) or {}).get('since') or start_date
+    return singer.utils.strptime_to_utc(since).strftime(DATETIME_FMT) if since else None
+
+
+def get_updated_params(stream_name, params, since):
+    """Add the `greater-than` filter on the replication key to the params of a full table stream."""
+    if since is None:
+        return params
+    updated_filter = f"greater-than({INCREMENTAL_REPLICATION_KEYS[stream_name]},{since})"
+    return {
+        **params,
+        "filter": f"{params['filter']},{updated_filter}" if params.get("filter") else updated_filter
+    }
+
+
+def get_latest_updated(since, records, replication_key):
+    """Return the latest of `since` and the replication key of the records, before they are flattened."""
+    values = [singer.utils.strptime_to_utc(record['attributes'][replication_key]).strftime(DATETIME_FMT)
+              for record in records if (record.get('attributes') or {}).get(replication_key)]
+    return max(values + ([since] if since else []), default=None)
+
+
+def get_updated_pulls(resource, endpoint, state, headers, start_date):
+    """
+    Incremental sync of a full table stream. The records of every params set which were updated
+    since the bookmark are written, the bookmark is moved to the latest of them once all the
+    params sets are complete as they are not sorted by their replication key.
+    """
+    replication_key = INCREMENTAL_REPLICATION_KEYS[resource['stream']]
+    since = latest = get_updated_since(resource, state, start_date)
+    streamed = is_streaming_parse_enabled()
+
+    with metrics.record_counter(resource['stream']) as counter, StateCheckpoint(state) as state_checkpoint:
+        for params in get_stream_params(resource['stream']):
+            params = {**get_updated_params(resource['stream'], params, since),
+                      **get_page_size_params(resource['stream'])}
+            valid_relationships = params.get("include","").split(",")
+            for page in get_all_using_next(resource['stream'], endpoint, headers, params, streamed):
+                for records, included in get_page_batches(resource['stream'], page, headers,
+                                                          valid_relationships, streamed):
+                    records = select_records(resource['stream'], records)
+                    counter.increment(len(records))
+                    latest = get_latest_updated(latest, records, replication_key)
+                    transfrom_and_write_records(records, resource, included, valid_relationships)
+        if latest is not None:
+            with output_lock:
+                st.set_bookmark(state, resource['tap_stream_id'], 'since', latest)
+                state_checkpoint.write()
+
+
+def get_record_transformer(stream):
+    """Return the transformer compiled from the schema and metadata of `stream`, built once per run."""
+    with transformers_lock:
+        cached = compiled_transformers.get(id(stream))
+        # The stream is kept with its transformer so its id is never reused by another stream
+        if cached is None or cached[0] is not stream:
+            cached = (stream, compile_transformer(stream))
+            compiled_transformers[id(stream)] = cached
+        return cached[1]
+
+
+def resolve_relationship(relationship, included):
+    included_relationship = included.get(get_included_key(relationship))
+    # Relationships which are not included are kept as they are
+    if included_relationship is None:
+        return relationship
+    # The flattened object is shared between events unless the relationship carries more than its identifier
+    if len(relationship) > 2:
+        return {**relationship, **included_relationship}
+    return included_relationship
+
+
+def transfrom_and_write_records(events, stream, included, valid_relationships, version=None):
     event_stream = stream['stream']
-    event_schema = stream['schema']
-    event_mdata = metadata.to_map(stream['metadata'])
-
-    with Transformer() as transformer:
-        for event in events:
-            # Flatten the event dict with attributes
-            event.update(event['attributes'])
-            for relationship_key, relationship_value in event.get('relationships',{}).items():
-                if not relationship_key in valid_relationships:
-                    continue
-                relationship_data = relationship_value['data']
-                # Generalizing relationship data to list of dicts for all streams
-                # This is due to the fact that, for Full table streams, data is returned as a list
-                # And, for incremental streams, data is return as a dict in API response
-                if isinstance(relationship_data, dict):
-                    relationship_data = [relationship_data]
-                for relationship in relationship_data:
-                    included_relationship = included.get(relationship['id'], None)
-                    # Check if current relationship is present in included relationship dict
-                    if included_relationship is not None:
-                        # Flatten the included_relationship dict with attributes
-                        included_relationship.update(included_relationship['attributes'])
-                        relationship.update(included_relationship)
-                event.update({relationship_key: relationship_data})
-            # write record
-            singer.write_record(
-                event_stream, 
-                transformer.transform(
-                    event, event_schema, event_mdata
-            ))
+    transformer = get_record_transformer(stream)
 
-# return the 'timeout'
-def get_request_timeout():
-    args = singer.utils.parse_args([])
-    # get the value of request timeout from config
-    config_request_timeout = args.config.get('request_timeout')
+    records = []
+    for event in events:
+        # Flatten the event dict with attributes
+        event.update(event['attributes'])
+        for relationship_key, relationship_value in event.get('relationships',{}).items():
+            if not relationship_key in valid_relationships:
+                continue
+            relationship_data = relationship_value['data']
+            # Generalizing relationship data to list of dicts for all streams
+            # This is due to the fact that, for Full table streams, data is returned as a list
+            # And, for incremental streams, data is return as a dict in API response
+            if isinstance(relationship_data, dict):
+                relationship_data = [relationship_data]
+            event.update({relationship_key: [resolve_relationship(relationship, included)
+                                             for relationship in relationship_data]})
+        records.append(transformer.transform(event))
 
-    # only return the timeout value if it is passed in the config and the value is not 0, "0" or ""
-    if config_request_timeout and float(config_request_timeout):
-        # return the timeout from config
-        return float(config_request_timeout)
+    write_records(event_stream, records, version)
 
-    # return default timeout
-    return REQUEST_TIMEOUT
+
+def write_records(stream_name, records, version=None):
+    """
+    Same messages as `singer.write_record`, serialized with the configured JSON backend.
+    The page is added to the output buffer at once so it is not interleaved with the records of other streams.
+    """
+    version = {'version': version} if version is not None else {}
+    chunk = "".join(json_codec.dumps({'type': 'RECORD', 'stream': stream_name, 'record': record, **version}) + '\n'
+                    for record in records)
+    with output_lock:
+        output_buffer.write(chunk)
+
+
+def write_state(state):
+    # The buffered records are written first so the state never bookmarks records which were not emitted
+    with output_lock:
+        output_buffer.flush()
+        singer.write_state(state)
+
+
+class StateCheckpoint(object):
+    """
+    Writes the state of a stream every `state_emit_interval_pages` pages and/or every
+    `state_emit_interval_seconds` seconds, after every page when none is configured.
+    The pending state is always written when the stream ends, also on an error, so the
+    bookmark of every written page is emitted.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self.interval_pages = runtime_settings.state_emit_interval_pages
+        self.interval_seconds = runtime_settings.state_emit_interval_seconds
+        self.pending_pages = 0
+        self.written_at = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def is_due(self):
+        if not self.interval_pages and not self.interval_seconds:
+            return True
+        if self.interval_pages and self.pending_pages >= self.interval_pages:
+            return True
+        return bool(self.interval_seconds) and time.monotonic() - self.written_at >= self.interval_seconds
+
+    def page_done(self):
+        """Called once the bookmark of a written page has been updated in the state."""
+        with output_lock:
+            self.pending_pages += 1
+            if self.is_due():
+                self.write()
+
+    def flush(self):
+        with output_lock:
+            if self.pending_pages:
+                self.write()
+
+    def write(self):
+        write_state(self.state)
+        self.pending_pages = 0
+        self.written_at = time.monotonic()
+
+
+def write_schema(stream):
+    with output_lock:
+        output_buffer.flush()
+        singer.write_schema(stream['stream'], stream['schema'], stream['key_properties'])
+
+
+def write_activate_version(stream_name, version):
+    with output_lock:
+        output_buffer.flush()
+        singer.write_message(singer.ActivateVersionMessage(stream_name, version))
+
+
+def flush_output():
+    with output_lock:
+        output_buffer.flush()
@@ -247,12 +247,21 @@ class KlaviyoBaseTest(unittest.TestCase):
                 in self.expected_metadata().items()}
 
     def expected_automatic_fields(self):
-        """return a dictionary with key of table name and set of value of automatic(primary key and bookmark field) fields"""
+        """return a dictionary with key of table name and set of value of automatic(primary key, bookmark field and selectable replication key) fields"""
         auto_fields = {}
         for k, v in self.expected_metadata().items():
-            auto_fields[k] = set(v.get(self.PRIMARY_KEYS, [])) | set(v.get(self.BOOKMARK, []))
+            auto_fields[k] = set(v.get(self.PRIMARY_KEYS, [])) | set(v.get(self.BOOKMARK, [])) | \
+                self.expected_selectable_replication_keys().get(k, set())
         return auto_fields
 
+    def expected_selectable_replication_keys(self):
+        """return a dictionary with key of full table streams which may be synced incrementally and value as their replication keys"""
+        return {
+            "global_exclusions": {"updated"},
+            "campaigns": {"updated_at"},
+            "lists": {"updated"},
+        }
+
     def expected_replication_method(self):
         """return a dictionary with key of table name and value of replication method"""
         return {table: properties.get(self.REPLICATION_METHOD, None)
@@ -392,7 +401,11 @@ class KlaviyoBaseTest(unittest.TestCase):
         
         stream_to_calculated_state = {stream: "" for stream in current_state['bookmarks'].keys()}
         for stream, state in current_state['bookmarks'].items():
-            state_key, state_value = next(iter(state.keys())), next(iter(state.values()))
+            # Full table streams are bookmarked by their table version, which is kept as it is
+            if 'since' not in state:
+                stream_to_calculated_state[stream] = state
+                continue
+            state_key, state_value = 'since', state['since']
             state_as_datetime = dateutil.parser.parse(state_value)
 
             days, hours, minutes = timedelta_by_stream[stream]
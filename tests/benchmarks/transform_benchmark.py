@@ -0,0 +1,65 @@
+"""
+Compare the CPU time `transfrom_and_write_records` spends transforming records with
+`singer.Transformer` and with the transformer compiled from the stream schema.
+
+    python tests/benchmarks/transform_benchmark.py [records]
+"""
+import copy
+import sys
+import timeit
+
+from singer import metadata, Transformer
+
+import tap_klaviyo
+from tap_klaviyo.transform import compile_transformer
+
+
+def get_event(index):
+    return {
+        "type": "event",
+        "id": "event_{}".format(index),
+        "uuid": "uuid_{}".format(index),
+        "timestamp": 1700000000 + index,
+        "datetime": "2023-11-14T22:13:20+00:00",
+        "event_properties": {"$value": 1.5, "Subject": "Hello", "$message": "m1",
+                             "$extra": {"items": [{"sku": "a", "price": 1}]}},
+        "profile": [{"type": "profile", "id": "p{}".format(index), "email": "a@b.c",
+                     "first_name": "First", "last_name": "Last", "created": "2023-01-01T00:00:00+00:00",
+                     "updated": "2023-06-01T00:00:00+00:00", "properties": {"a": 1},
+                     "location": {"city": "x"}}],
+        "metric": [{"type": "metric", "id": "m1", "name": "Received Email",
+                    "created": "2020-01-01T00:00:00+00:00", "updated": "2020-01-01T00:00:00+00:00",
+                    "integration": {"name": "Klaviyo"}}],
+    }
+
+
+def generic_transform(records, stream):
+    # The current path: a Transformer and the metadata map built for every page
+    with Transformer() as transformer:
+        mdata = metadata.to_map(stream['metadata'])
+        return [transformer.transform(record, stream['schema'], mdata) for record in records]
+
+
+def compiled_transform(records, stream):
+    transformer = compile_transformer(stream)
+    return [transformer.transform(record) for record in records]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    stream = tap_klaviyo.Stream('receive', 'metric_1', ['id'], 'INCREMENTAL', ['timestamp']).to_catalog_dict()
+    records = [get_event(index) for index in range(count)]
+
+    assert generic_transform(copy.deepcopy(records), stream) == compiled_transform(copy.deepcopy(records), stream)
+
+    results = {}
+    for name, transform in (("singer.Transformer", generic_transform), ("compiled", compiled_transform)):
+        copies = [copy.deepcopy(records) for _ in range(3)]
+        results[name] = min(timeit.repeat(lambda: transform(copies.pop(), stream), number=1, repeat=3))
+        print("{:<20} {:>8.3f}s  {:>8.1f} us/record".format(name, results[name], results[name] / count * 1e6))
+
+    print("speedup: {:.1f}x".format(results["singer.Transformer"] / results["compiled"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -162,9 +162,16 @@ class BookmarkTest(KlaviyoBaseTest):
 
                 elif expected_replication_method == self.FULL_TABLE:
 
-                    # Verify the syncs do not set a bookmark for full table streams
-                    self.assertIsNone(first_bookmark_key_value)
-                    self.assertIsNone(second_bookmark_key_value)
+                    # Verify the syncs bookmark the table version of full table streams
+                    self.assertIsNotNone(first_bookmark_key_value)
+                    self.assertIsNotNone(second_bookmark_key_value)
+                    self.assertIsInstance(first_bookmark_key_value.get('version'), int)
+                    self.assertNotIn('since', first_bookmark_key_value)
+
+                    # Verify the position of the completed syncs is cleared and every sync has a new version
+                    self.assertNotIn('next_urls', first_bookmark_key_value)
+                    self.assertNotIn('next_urls', second_bookmark_key_value)
+                    self.assertGreater(second_bookmark_key_value['version'], first_bookmark_key_value['version'])
 
                     # Verify the number of records in the second sync is the same as the first
                     self.assertEqual(second_sync_count, first_sync_count)
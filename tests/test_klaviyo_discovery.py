@@ -54,7 +54,9 @@ class DiscoveryTest(KlaviyoBaseTest):
                 expected_primary_keys = self.expected_primary_keys()[stream]
                 expected_replication_method = self.expected_replication_method()[stream]
                 expected_automatic_fields = self.expected_automatic_fields()[stream]
-                expected_replication_keys = self.expected_bookmark_keys()[stream]
+                expected_bookmark_keys = self.expected_bookmark_keys()[stream]
+                expected_replication_keys = expected_bookmark_keys | \
+                    self.expected_selectable_replication_keys().get(stream, set())
 
                 # collecting actual values...
                 schema_and_metadata = menagerie.get_annotated_schema(conn_id, catalog['stream_id'])
@@ -62,8 +64,10 @@ class DiscoveryTest(KlaviyoBaseTest):
                 stream_properties = [item for item in metadata if item.get("breadcrumb") == []]
                 actual_primary_keys = stream_properties[0].get(
                     "metadata", {self.PRIMARY_KEYS: None}).get(self.PRIMARY_KEYS)
+                # Full table streams which may be synced incrementally default to FULL_TABLE
                 actual_replication_method = stream_properties[0].get(
-                    "metadata", {self.REPLICATION_METHOD: None}).get(self.REPLICATION_METHOD)
+                    "metadata", {self.REPLICATION_METHOD: None}).get(self.REPLICATION_METHOD) or \
+                    stream_properties[0].get("metadata", {}).get("replication-method")
                 actual_automatic_fields = set(
                     item.get("breadcrumb", ["properties", None])[1] for item in metadata
                     if item.get("metadata").get("inclusion") == "automatic"
@@ -103,7 +107,7 @@ class DiscoveryTest(KlaviyoBaseTest):
                     
                 
                 # verify that if there is a replication key we are doing INCREMENTAL otherwise FULL
-                if expected_replication_keys:
+                if expected_bookmark_keys:
                     self.assertEqual(actual_replication_method,self.INCREMENTAL)
                 else:
                     self.assertEqual(actual_replication_method,self.FULL_TABLE)  
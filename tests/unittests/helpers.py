@@ -0,0 +1,36 @@
+import json
+
+import requests
+
+import tap_klaviyo
+
+
+class MockResponse:
+    """Response of `requests.Session.request` with `resp` as its JSON body."""
+
+    def __init__(self, resp=None, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.json_data = resp if resp is not None else {}
+
+    @property
+    def content(self):
+        return json.dumps(self.json_data).encode()
+
+    def json(self):
+        return self.json_data
+
+    def raise_for_status(self):
+        if self.status_code != 200:
+            raise requests.HTTPError()
+
+
+def get_event_stream(stream_name="receive", metric_id="M1", selected=False):
+    stream = tap_klaviyo.Stream(stream_name, metric_id, ["id"], "INCREMENTAL", ["timestamp"]).to_catalog_dict()
+    if selected:
+        stream["metadata"][0]["metadata"]["selected"] = True
+    return stream
+
+
+def get_full_table_stream(name="lists"):
+    return tap_klaviyo.Stream(name, name, ["id"], "FULL_TABLE").to_catalog_dict()
@@ -0,0 +1,173 @@
+import asyncio
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import tap_klaviyo
+import tap_klaviyo.aio as aio
+import tap_klaviyo.utils as utils_
+
+
+class MockAsyncResponse:
+    def __init__(self, status, resp, headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self.body = json.dumps(resp) if not isinstance(resp, str) else resp
+
+    async def read(self):
+        return self.body.encode()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+class MockClient:
+    """Replays the responses in order and records the requested urls"""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, params=None, headers=None):
+        self.requests.append((url, params))
+        return self.responses.pop(0)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@mock.patch("asyncio.sleep", new_callable=mock.AsyncMock)
+class TestAsyncAuthedGet(unittest.TestCase):
+
+    def test_page_is_returned(self, mocked_sleep):
+        client = MockClient([MockAsyncResponse(200, {"data": [{"id": "1"}], "links": {"next": "next"}})])
+
+        page = run(aio.async_authed_get(client, "events", "https://a.klaviyo.com/api/events", {}, {}))
+
+        self.assertEqual(page.data, [{"id": "1"}])
+        self.assertEqual(page.next_url, "next")
+
+    def test_error_mapping(self, mocked_sleep):
+        """Verify that the HTTP errors raise the same exceptions as the synchronous engine"""
+        client = MockClient([MockAsyncResponse(403, {"message": "The API key specified is invalid."})])
+
+        with self.assertRaises(utils_.KlaviyoForbiddenError) as e:
+            run(aio.async_authed_get(client, "events", "https://a.klaviyo.com/api/events", {}, {}))
+
+        self.assertEqual(str(e.exception), "HTTP-error-code: 403, Error: The API key specified is invalid.")
+
+    def test_server_error_is_retried_3_times(self, mocked_sleep):
+        client = MockClient([MockAsyncResponse(500, {}) for _ in range(3)])
+
+        with self.assertRaises(utils_.KlaviyoInternalServiceError):
+            run(aio.async_authed_get(client, "events", "https://a.klaviyo.com/api/events", {}, {}))
+
+        self.assertEqual(len(client.requests), 3)
+
+    def test_json_decode_error_is_retried(self, mocked_sleep):
+        client = MockClient([MockAsyncResponse(200, "{not json"),
+                             MockAsyncResponse(200, {"data": [], "links": {}})])
+
+        page = run(aio.async_authed_get(client, "events", "https://a.klaviyo.com/api/events", {}, {}))
+
+        self.assertEqual(page.data, [])
+        self.assertEqual(len(client.requests), 2)
+
+    def test_timeout_is_retried_5_times(self, mocked_sleep):
+        client = mock.Mock()
+        client.get.side_effect = asyncio.TimeoutError
+
+        with self.assertRaises(asyncio.TimeoutError):
+            run(aio.async_authed_get(client, "events", "https://a.klaviyo.com/api/events", {}, {}))
+
+        self.assertEqual(client.get.call_count, 5)
+
+
+class TestAsyncSync(unittest.TestCase):
+
+    def tearDown(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({}))
+
+    def setUp(self):
+        utils_.metric_cache.clear()
+
+    def test_incremental_pull(self):
+        """Verify that the async pull follows the pages, writes the records and the bookmark"""
+        metric = {"type": "metric", "id": "M1", "attributes": {"name": "Received Email"}}
+        client = MockClient([
+            MockAsyncResponse(200, {"data": [{"id": "1", "attributes": {"timestamp": 1700000000},
+                                              "relationships": {"metric": {"data": {"type": "metric", "id": "M1"}}}}],
+                                    "links": {"next": "https://a.klaviyo.com/api/events?page[cursor]=x"}}),
+            MockAsyncResponse(200, {"data": metric}),
+            MockAsyncResponse(200, {"data": [{"id": "2", "attributes": {"timestamp": 1700000010}}],
+                                    "links": {"next": None}}),
+        ])
+        stream = tap_klaviyo.Stream("receive", "M1", ["id"], "INCREMENTAL", ["timestamp"]).to_catalog_dict()
+        state = {"bookmarks": {}}
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            run(aio.async_get_incremental_pull(client, stream, "https://a.klaviyo.com/api/events", state, {},
+                                               "2023-01-01T00:00:00Z"))
+
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        records = [record["record"] for record in records if record["type"] == "RECORD"]
+        self.assertEqual([record["id"] for record in records], ["1", "2"])
+        # The metric is requested once with the first events and attached to the records locally
+        self.assertEqual(client.requests[1][0], "https://a.klaviyo.com/api/metrics/M1")
+        self.assertEqual(records[0]["metric"], [{"type": "metric", "id": "M1", "name": "Received Email"}])
+        self.assertEqual(client.requests[2], ("https://a.klaviyo.com/api/events?page[cursor]=x", {}))
+        self.assertEqual(state["bookmarks"]["M1"]["since"], utils_.ts_to_dt(1700000009))
+
+    def test_full_pull_pages_params_sets_concurrently(self):
+        """Verify that the params sets of a full table stream are paged together and all their records written"""
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({"max_concurrent_params_sets": 4}))
+        client = MockClient([MockAsyncResponse(200, {"data": [{"type": "profile", "id": str(index), "attributes": {}}],
+                                                     "links": {"next": None}})
+                             for index in range(4)])
+        stream = tap_klaviyo.Stream("global_exclusions", "global_exclusions", ["id"], "FULL_TABLE").to_catalog_dict()
+        state = {}
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            run(aio.async_get_full_pulls(client, stream, "https://a.klaviyo.com/api/profiles", {}, state))
+
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(sorted(message["record"]["id"] for message in messages if message["type"] == "RECORD"),
+                         ["0", "1", "2", "3"])
+        self.assertEqual(sorted(params["filter"] for _, params in client.requests),
+                         sorted(params["filter"] for params in utils_.STREAM_PARAMS_MAP["global_exclusions"]))
+        self.assertEqual(state["bookmarks"]["global_exclusions"], {"version": messages[0]["version"]})
+
+    def test_run_concurrently_limits_and_raises(self):
+        running = []
+        max_running = []
+
+        async def job(fail=False):
+            running.append(1)
+            max_running.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+            if fail:
+                raise utils_.KlaviyoBadRequestError("bad")
+
+        jobs = [job for _ in range(6)] + [lambda: job(fail=True)]
+        with self.assertRaises(utils_.KlaviyoBadRequestError):
+            run(aio.run_concurrently(jobs, 2))
+
+        self.assertEqual(max(max_running), 2)
+
+    @unittest.skipIf(aio.aiohttp is None, "aiohttp is not installed")
+    def test_client_session_uses_settings(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({"pool_size": 50, "request_timeout": 30}))
+
+        async def get_session():
+            async with aio.create_client_session() as client:
+                return client.connector.limit, client.timeout.total
+
+        self.assertEqual(run(get_session()), (50, 30.0))
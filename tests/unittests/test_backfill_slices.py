@@ -0,0 +1,88 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import tap_klaviyo.utils as utils_
+from helpers import MockResponse, get_event_stream
+
+DAY = 24 * 60 * 60
+START = 1600000000
+
+
+class TestBackfillSlices(unittest.TestCase):
+
+    def test_slices_cover_range(self):
+        """Verify that the range is split in contiguous slices and the last one is open ended"""
+        slices = utils_.get_backfill_slices(START, START + 30 * DAY, 3)
+
+        self.assertEqual(slices, [(START, START + 10 * DAY), (START + 10 * DAY, START + 20 * DAY),
+                                  (START + 20 * DAY, None)])
+
+    def test_short_range_is_not_sliced(self):
+        """Verify that slices cover at least a day"""
+        self.assertEqual(utils_.get_backfill_slices(START, START + DAY + 10, 8), [(START, None)])
+
+    def test_bookmark_advances_through_completed_prefix(self):
+        slices = utils_.get_backfill_slices(START, START + 30 * DAY, 3)
+        progress = utils_.BackfillProgress(slices)
+        self.assertIsNone(progress.get_bookmark())
+
+        # a later slice completing does not move the bookmark
+        progress.update(1, [{"timestamp": START + 15 * DAY}])
+        progress.complete(1)
+        self.assertIsNone(progress.get_bookmark())
+
+        # the first slice in progress moves it to its latest event
+        progress.update(0, [{"timestamp": START + 5}])
+        self.assertEqual(progress.get_bookmark(), START + 4)
+
+        # completing the first slice moves it to the end of the completed prefix
+        progress.complete(0)
+        self.assertEqual(progress.get_bookmark(), START + 20 * DAY)
+
+        progress.update(2, [{"timestamp": START + 25 * DAY}])
+        progress.complete(2)
+        self.assertEqual(progress.get_bookmark(), START + 25 * DAY - 1)
+
+
+class TestSlicedIncrementalPull(unittest.TestCase):
+
+    def setUp(self):
+        utils_.metric_cache.clear()
+
+    def tearDown(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({}))
+
+    @mock.patch("time.time", return_value=START + 30 * DAY)
+    @mock.patch("requests.Session.request")
+    def test_sliced_pull(self, mocked_request, mocked_time):
+        """Verify that every slice is requested with its bounds and the final bookmark covers all slices"""
+        def get_events(method, url, params, headers, timeout):
+            if "/api/metrics/" in url:
+                return MockResponse({"data": {"type": "metric", "id": "M1", "attributes": {}}})
+            bounds = [int(part.split(",")[1].rstrip(")")) for part in params["filter"].split("),")[1:]]
+            event = {"id": str(bounds[0]), "attributes": {"timestamp": bounds[0] + 100}, "relationships": {}}
+            return MockResponse({"data": [event], "links": {}})
+        mocked_request.side_effect = get_events
+
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({"backfill_slices": 3}))
+        stream = get_event_stream()
+        state = {"bookmarks": {}}
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            utils_.get_incremental_pull(stream, "https://a.klaviyo.com/api/events", state, {},
+                                        utils_.ts_to_dt(START))
+
+        filters = sorted(call[1]["params"]["filter"] for call in mocked_request.call_args_list
+                         if "filter" in call[1]["params"])
+        self.assertEqual(filters, [
+            f'equals(metric_id,"M1"),greater-or-equal(timestamp,{START}),less-than(timestamp,{START + 10 * DAY})',
+            f'equals(metric_id,"M1"),greater-or-equal(timestamp,{START + 10 * DAY}),less-than(timestamp,{START + 20 * DAY})',
+            f'equals(metric_id,"M1"),greater-or-equal(timestamp,{START + 20 * DAY})',
+        ])
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len([record for record in records if record["type"] == "RECORD"]), 3)
+        self.assertEqual(state["bookmarks"]["M1"]["since"], utils_.ts_to_dt(START + 20 * DAY + 99))
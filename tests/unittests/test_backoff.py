@@ -42,6 +42,7 @@ class TestBackoff(unittest.TestCase):
         mock_resp = mock.Mock()
 
         mock_resp.status_code = 200
+        mock_resp.content = b"{invalid json"
         mock_resp.json.side_effect = simplejson.scanner.JSONDecodeError("", "", 1)
 
         mocked_request.return_value = mock_resp
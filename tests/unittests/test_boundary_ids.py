@@ -0,0 +1,61 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import tap_klaviyo.utils as utils_
+from helpers import MockResponse, get_event_stream
+
+START = 1700000000
+
+
+def get_event(event_id, timestamp):
+    return {"type": "event", "id": event_id, "attributes": {"timestamp": timestamp}}
+
+
+def get_stream():
+    stream = get_event_stream()
+    stream["metadata"] = [{"breadcrumb": ["properties", "metric"], "metadata": {"selected": False}}]
+    return stream
+
+
+class TestBoundaryIds(unittest.TestCase):
+
+    def pull(self, state, events):
+        output = io.StringIO()
+        with mock.patch("requests.Session.request", return_value=MockResponse({"data": events, "links": {}})), \
+                redirect_stdout(output):
+            utils_.get_incremental_pull(get_stream(), "https://a.klaviyo.com/api/events", state, {},
+                                        "2023-01-01T00:00:00Z")
+        return [message["record"]["id"] for message in map(json.loads, output.getvalue().splitlines())
+                if message["type"] == "RECORD"]
+
+    def test_events_of_the_bookmark_second_are_skipped_by_the_next_sync(self):
+        state = {"bookmarks": {}}
+        records = self.pull(state, [get_event("a", START), get_event("b", START + 9), get_event("c", START + 10)])
+
+        self.assertEqual(records, ["a", "b", "c"])
+        self.assertEqual(state["bookmarks"]["M1"], {"since": utils_.ts_to_dt(START + 9), "boundary_ids": ["b", "c"]})
+
+        # the next sync reads the events from the bookmark second again
+        records = self.pull(state, [get_event("b", START + 9), get_event("c", START + 10), get_event("d", START + 10)])
+
+        self.assertEqual(records, ["d"])
+        self.assertEqual(state["bookmarks"]["M1"], {"since": utils_.ts_to_dt(START + 9),
+                                                    "boundary_ids": ["b", "c", "d"]})
+
+    def test_ids_of_older_bookmarks_are_dropped(self):
+        state = {"bookmarks": {"M1": {"since": utils_.ts_to_dt(START), "boundary_ids": ["a"]}}}
+        records = self.pull(state, [get_event("a", START), get_event("b", START + 100)])
+
+        self.assertEqual(records, ["b"])
+        self.assertEqual(state["bookmarks"]["M1"], {"since": utils_.ts_to_dt(START + 99), "boundary_ids": ["b"]})
+
+    @mock.patch("tap_klaviyo.utils.MAX_BOUNDARY_IDS", 2)
+    def test_too_many_ids_are_not_kept(self):
+        state = {"bookmarks": {}}
+        self.pull(state, [get_event(event_id, START) for event_id in ("a", "b", "c")])
+
+        # the events are written again by the next sync, like without boundary ids
+        self.assertEqual(state["bookmarks"]["M1"], {"since": utils_.ts_to_dt(START - 1)})
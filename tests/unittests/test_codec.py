@@ -0,0 +1,92 @@
+import decimal
+import io
+import sys
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import simplejson
+
+import tap_klaviyo.utils as utils_
+from tap_klaviyo import codec, output
+
+RECORD = {
+    "id": "abc",
+    "name": "Ünïcode ✓",
+    "count": 3,
+    "ratio": 0.25,
+    "flags": [True, False, None],
+    "nested": {"empty": {}, "list": []},
+}
+
+
+class TestGetCodec(unittest.TestCase):
+
+    @mock.patch("tap_klaviyo.codec.orjson", None)
+    def test_auto_without_orjson(self):
+        self.assertIsInstance(codec.get_codec("auto"), codec.SimplejsonCodec)
+        self.assertNotIsInstance(codec.get_codec("auto"), codec.OrjsonCodec)
+
+    @mock.patch("tap_klaviyo.codec.orjson", None)
+    def test_orjson_not_installed(self):
+        with self.assertRaises(ImportError):
+            codec.get_codec("orjson")
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            codec.get_codec("ujson")
+
+
+@unittest.skipIf(codec.orjson is None, "orjson is not installed")
+class TestOrjsonCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.orjson_codec = codec.get_codec("orjson")
+        self.simplejson_codec = codec.get_codec("simplejson")
+
+    def test_same_records_as_simplejson(self):
+        encoded = self.orjson_codec.dumps(RECORD)
+        self.assertEqual(simplejson.loads(encoded), simplejson.loads(self.simplejson_codec.dumps(RECORD)))
+        self.assertEqual(self.orjson_codec.loads(encoded.encode()), RECORD)
+
+    def test_unsupported_values_fall_back_to_simplejson(self):
+        record = {"big": 2 ** 70, "amount": decimal.Decimal("1.10")}
+        self.assertEqual(self.orjson_codec.dumps(record), self.simplejson_codec.dumps(record))
+        self.assertEqual(self.orjson_codec.loads(b'{"big": 1180591620717411303424}'), {"big": 2 ** 70})
+
+    def test_invalid_body_raises_simplejson_error(self):
+        # `authed_get` retries on simplejson's JSONDecodeError
+        with self.assertRaises(simplejson.scanner.JSONDecodeError):
+            self.orjson_codec.loads(b"{invalid json")
+
+    def test_non_finite_floats_raise_like_simplejson(self):
+        for value in (float("nan"), float("inf"), -float("inf")):
+            record = {"id": "abc", "values": [1.5, {"ratio": value}]}
+            with self.assertRaises(ValueError):
+                self.simplejson_codec.dumps(record)
+            with self.assertRaises(ValueError):
+                self.orjson_codec.dumps(record)
+        # null values alone are still encoded by orjson
+        self.assertEqual(simplejson.loads(self.orjson_codec.dumps({"value": None, "ratio": 0.5})),
+                         {"value": None, "ratio": 0.5})
+
+    def test_write_records(self):
+        buffer = io.StringIO()
+        with mock.patch("tap_klaviyo.utils.json_codec", self.orjson_codec), redirect_stdout(buffer):
+            utils_.write_records("events", [RECORD])
+            utils_.flush_output()
+        message = simplejson.loads(buffer.getvalue())
+        self.assertEqual(message, {"type": "RECORD", "stream": "events", "record": RECORD})
+
+
+class TestUtf8Stdout(unittest.TestCase):
+
+    def test_non_ascii_records_are_written_as_utf8(self):
+        raw = io.BytesIO()
+        stdout = io.TextIOWrapper(raw, encoding="ascii")
+        with mock.patch("sys.stdout", stdout):
+            output.use_utf8_stdout()
+            sys.stdout.write(RECORD["name"])
+            sys.stdout.flush()
+
+        self.assertIn("Ünïcode ✓".encode("utf-8"), raw.getvalue())
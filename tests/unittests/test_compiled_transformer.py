@@ -0,0 +1,104 @@
+import copy
+import unittest
+
+from singer import metadata, Transformer
+from singer.transform import SchemaMismatch
+
+import tap_klaviyo
+import tap_klaviyo.utils as utils_
+from tap_klaviyo.transform import CompiledTransformer, compile_transformer
+
+EVENT = {
+    "type": "event",
+    "id": "event_1",
+    "uuid": "uuid_1",
+    "timestamp": "1,700,000,000",
+    "datetime": "2023-11-14T22:13:20+00:00",
+    "event_properties": {"$value": 1.5, "nested": {"list": [1, 2]}},
+    "unknown_field": "removed",
+    "profile": [{"type": "profile", "id": "p1", "email": "a@b.c", "created": "2023-01-01T00:00:00Z"}],
+    "metric": [{"type": "metric", "id": "m1", "name": "Received Email", "integration": None}],
+}
+
+PROFILES = [
+    {"id": "1", "email": "a@b.c", "created": "2023-01-01T00:00:00.123+00:00",
+     "updated": "2023-01-01T05:30:00+05:30", "last_event_date": "2023-01-01 10:00:00",
+     "location": {"city": "x"}, "subscriptions": None, "phone_number": ""},
+    {"id": 2, "created": "2023-01-01T00:00:00.123456Z", "updated": "", "last_event_date": None,
+     "properties": {}, "predictive_analytics": {"a": 1}},
+    {"id": "3", "created": "January 1 2023", "updated": "2023-02-28T23:59:59-08:00", "title": 5},
+]
+
+
+def get_catalog_entry(stream):
+    return stream.to_catalog_dict()
+
+
+def generic_transform(record, schema, mdata):
+    with Transformer() as transformer:
+        return transformer.transform(copy.deepcopy(record), schema, mdata)
+
+
+class TestCompiledTransformer(unittest.TestCase):
+
+    def assert_same_output(self, entry, records):
+        mdata = metadata.to_map(entry['metadata'])
+        transformer = compile_transformer(entry)
+        for record in records:
+            expected = generic_transform(record, copy.deepcopy(entry['schema']), mdata)
+            self.assertEqual(transformer.transform(copy.deepcopy(record)), expected)
+
+    def test_event_streams(self):
+        entry = get_catalog_entry(tap_klaviyo.Stream('receive', 'metric_1', ['id'], 'INCREMENTAL', ['timestamp']))
+        events = [EVENT, {**EVENT, "timestamp": None, "profile": None, "metric": []},
+                  {**EVENT, "event_properties": None, "datetime": ""}]
+        self.assert_same_output(entry, events)
+
+    def test_full_table_streams(self):
+        for stream in tap_klaviyo.FULL_STREAMS:
+            entry = get_catalog_entry(stream)
+            self.assert_same_output(entry, PROFILES + [{"id": "4", "name": "list", "created": "2023-01-01T00:00:00Z",
+                                                        "tags": [{"id": "t1"}], "archived": "false"}])
+
+    def test_deselected_fields(self):
+        entry = get_catalog_entry(tap_klaviyo.Stream('receive', 'metric_1', ['id'], 'INCREMENTAL', ['timestamp']))
+        mdata = metadata.to_map(entry['metadata'])
+        for field in ("event_properties", "profile", "timestamp"):
+            mdata = metadata.write(mdata, ('properties', field), 'selected', False)
+        entry['metadata'] = metadata.to_list(mdata)
+        self.assert_same_output(entry, [EVENT])
+        self.assertNotIn("event_properties", compile_transformer(entry).transform(copy.deepcopy(EVENT)))
+
+    def test_nested_deselected_fields(self):
+        schema = {"type": "object", "properties": {
+            "a": {"type": "object", "properties": {"b": {"type": "string"}, "c": {"type": "string"}}}}}
+        mdata = {(): {}, ("properties", "a", "properties", "c"): {"selected": False}}
+        transformer = CompiledTransformer(schema, mdata)
+        self.assertEqual(transformer.transform({"a": {"b": "1", "c": "2"}}), {"a": {"b": "1"}})
+
+    def test_other_types_and_any_of(self):
+        schema = {"type": "object", "properties": {
+            "amount": {"type": ["null", "string"], "format": "singer.decimal"},
+            "value": {"anyOf": [{"type": "integer"}, {"type": "string"}]},
+            "untyped": {},
+            "flag": {"type": ["boolean", "null"]},
+            "ratio": {"type": "number"},
+        }, "patternProperties": {"^x_": {"type": "integer"}}}
+        records = [{"amount": 1.1, "value": "a", "untyped": [1], "flag": "False", "ratio": "1,000.5", "x_1": "2"},
+                   {"amount": None, "value": 3, "flag": 0, "ratio": 1, "y_1": "removed"}]
+        for record in records:
+            self.assertEqual(CompiledTransformer(schema, {}).transform(copy.deepcopy(record)),
+                             generic_transform(record, schema, {}))
+
+    def test_schema_mismatch(self):
+        schema = {"type": "object", "properties": {"count": {"type": "integer"},
+                                                   "created": {"type": ["null", "string"], "format": "date-time"}}}
+        for record in ({"count": "not a number"}, {"created": "2023-02-30T00:00:00Z"}, {"created": "2023-02-28T24:00:00Z"}):
+            with self.assertRaises(SchemaMismatch):
+                CompiledTransformer(schema, {}).transform(record)
+
+    def test_transformer_is_compiled_once_per_stream(self):
+        entry = get_catalog_entry(tap_klaviyo.LISTS)
+        self.assertIs(utils_.get_record_transformer(entry), utils_.get_record_transformer(entry))
+        self.assertIsNot(utils_.get_record_transformer(entry),
+                         utils_.get_record_transformer(copy.deepcopy(entry)))
@@ -0,0 +1,113 @@
+import io
+import json
+import threading
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import tap_klaviyo
+import tap_klaviyo.utils as utils_
+from helpers import MockResponse, get_event_stream
+
+
+def get_event(metric_id, index):
+    return {"type": "event", "id": f"{metric_id}-{index}",
+            "attributes": {"timestamp": 1700000000 + index, "datetime": "2023-11-14T22:13:20+00:00"},
+            "relationships": {"metric": {"data": {"type": "metric", "id": metric_id}}}}
+
+
+def mocked_request(method, url, params, headers, timeout):
+    """Return two pages of events for the metric in the filter of the first request"""
+    if "/api/metrics/" in url:
+        metric_id = url.rsplit("/", 1)[1]
+        return MockResponse({"data": {"type": "metric", "id": metric_id, "attributes": {"name": metric_id}}})
+    if params:
+        metric_id = params["filter"].split('"')[1]
+        return MockResponse({"data": [get_event(metric_id, 0)], "links": {"next": f"next-{metric_id}"}})
+    metric_id = url.split("-", 1)[1]
+    return MockResponse({"data": [get_event(metric_id, 1)], "links": {"next": None}})
+
+
+def get_selected_catalog(metric_ids):
+    streams = []
+    for metric_id, stream_name in metric_ids.items():
+        streams.append(get_event_stream(stream_name, metric_id, selected=True))
+    return {"streams": streams}
+
+
+class TestConcurrentSync(unittest.TestCase):
+
+    def setUp(self):
+        utils_.metric_cache.clear()
+
+    def tearDown(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({}))
+
+    @mock.patch("requests.Session.request", side_effect=mocked_request)
+    def test_concurrent_streams_output_is_well_formed(self, mocked_session_request):
+        """Verify that every stream writes its SCHEMA first and its STATE only after its records"""
+        metric_ids = {"M1": "receive", "M2": "click", "M3": "open", "M4": "bounce"}
+        config = {"start_date": "2023-01-01T00:00:00Z", "max_concurrent_streams": 3}
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config(config))
+        state = {"bookmarks": {}}
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            tap_klaviyo.do_sync(config, state, get_selected_catalog(metric_ids), {})
+
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+        for metric_id, stream_name in metric_ids.items():
+            stream_messages = [(index, message) for index, message in enumerate(messages)
+                               if message.get("stream") == stream_name]
+            self.assertEqual(stream_messages[0][1]["type"], "SCHEMA")
+            self.assertEqual([message["record"]["id"] for _, message in stream_messages[1:]],
+                             [f"{metric_id}-0", f"{metric_id}-1"])
+            self.assertEqual(stream_messages[1][1]["record"]["metric"][0]["name"], metric_id)
+            last_record_index = stream_messages[-1][0]
+            # the bookmark of the stream is only written after its last record
+            state_indexes = [index for index, message in enumerate(messages)
+                             if message["type"] == "STATE"
+                             and message["value"]["bookmarks"].get(metric_id, {}).get("since") == utils_.ts_to_dt(1700000000)]
+            self.assertTrue(state_indexes)
+            self.assertGreater(min(state_indexes), last_record_index)
+        # Every metric is requested once
+        metric_urls = [call[1]["url"] for call in mocked_session_request.call_args_list
+                       if "/api/metrics/" in call[1]["url"]]
+        self.assertEqual(sorted(metric_urls), [f"https://a.klaviyo.com/api/metrics/{metric_id}" for metric_id in metric_ids])
+
+    @mock.patch("tap_klaviyo.get_incremental_pull", side_effect=utils_.KlaviyoBadRequestError("bad"))
+    def test_worker_error_is_raised(self, mocked_get_incremental_pull):
+        config = {"start_date": "2023-01-01T00:00:00Z", "max_concurrent_streams": 2}
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config(config))
+
+        with redirect_stdout(io.StringIO()):
+            with self.assertRaises(utils_.KlaviyoBadRequestError):
+                tap_klaviyo.do_sync(config, {"bookmarks": {}}, get_selected_catalog({"M1": "receive", "M2": "click"}), {})
+
+    def test_worker_error_stops_the_running_streams(self):
+        """Verify that a stream still paging stops at its next page once another stream failed"""
+        config = {"start_date": "2023-01-01T00:00:00Z", "max_concurrent_streams": 2}
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config(config))
+        paging = threading.Event()
+        requested = []
+
+        def request(method, url, params, headers, timeout):
+            if "/api/metrics/" in url:
+                return mocked_request(method, url, params, headers, timeout)
+            requested.append(url)
+            if params and "M1" in params["filter"]:
+                # M1 fails once M2 requested its next page
+                paging.wait(5)
+                raise utils_.KlaviyoBadRequestError("bad")
+            if not params:
+                paging.set()
+                # the page being requested when M1 fails is still written
+                utils_.sync_stopped.wait(5)
+            return MockResponse({"data": [get_event("M2", len(requested))], "links": {"next": "next-M2"}})
+
+        with mock.patch("requests.Session.request", side_effect=request), redirect_stdout(io.StringIO()):
+            with self.assertRaises(utils_.KlaviyoBadRequestError):
+                tap_klaviyo.do_sync(config, {"bookmarks": {}}, get_selected_catalog({"M1": "receive", "M2": "click"}), {})
+
+        # the first page of each stream and the page requested by the other stream before it stopped
+        self.assertEqual(len(requested), 3)
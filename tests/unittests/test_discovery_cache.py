@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import tap_klaviyo
+import tap_klaviyo.utils as utils_
+from tap_klaviyo.discovery_cache import DiscoveryCache, get_discovery_cache
+from helpers import MockResponse
+
+METRICS = [
+    {"type": "metric", "id": "M1", "attributes": {"name": "Received Email"}},
+    {"type": "metric", "id": "M2", "attributes": {"name": "Custom Integration Metric"}},
+    {"type": "metric", "id": "M3", "attributes": {"name": "Opened Email"}},
+]
+
+
+class TestDiscoveryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        utils_.metric_cache.clear()
+
+    def tearDown(self):
+        self.directory.cleanup()
+        utils_.metric_cache.clear()
+
+    def get_cache(self, **config):
+        return get_discovery_cache({"api_key": "pk_123", "discovery_cache_dir": self.directory.name, **config},
+                                   tap_klaviyo.API_VERSION)
+
+    def discover(self, discovery_cache):
+        with mock.patch("requests.Session.request",
+                        return_value=MockResponse({"data": METRICS, "links": {"next": None}})) as mocked_request:
+            catalog = tap_klaviyo.discover({}, discovery_cache)
+        return catalog, mocked_request.call_count
+
+    def test_warm_discovery_does_not_request_the_metrics(self):
+        cold_catalog, cold_requests = self.discover(self.get_cache())
+        utils_.metric_cache.clear()
+        warm_catalog, warm_requests = self.discover(self.get_cache())
+
+        self.assertEqual((cold_requests, warm_requests), (1, 0))
+        self.assertEqual(warm_catalog, cold_catalog)
+        self.assertEqual([stream["tap_stream_id"] for stream in warm_catalog["streams"]][:2], ["M1", "M3"])
+        # the metrics attached to the event records are also restored
+        self.assertEqual(utils_.get_cached_metric("M1")["name"], "Received Email")
+
+    def test_every_metric_is_cached(self):
+        discovery_cache = self.get_cache()
+        self.discover(discovery_cache)
+
+        self.assertEqual([metric["id"] for metric in discovery_cache.load()], ["M1", "M2", "M3"])
+
+    def test_cache_written_by_another_tap_version_is_matched_with_the_event_streams(self):
+        """Verify that a metric whose event mapping was renamed or removed since the cache was written is skipped"""
+        discovery_cache = self.get_cache()
+        discovery_cache.save([{"type": "metric", "id": "S1", "attributes": {"name": "Received SMS"}},
+                              {"type": "metric", "id": "M3", "attributes": {"name": "Opened Email"}}])
+
+        catalog, requests = self.discover(discovery_cache)
+
+        self.assertEqual(requests, 0)
+        self.assertEqual([stream["tap_stream_id"] for stream in catalog["streams"]][:1], ["M3"])
+        self.assertNotIn("S1", [stream["tap_stream_id"] for stream in catalog["streams"]])
+
+    def test_expired_cache_is_discovered_again(self):
+        self.discover(self.get_cache())
+
+        with mock.patch("time.time", return_value=os.path.getmtime(self.get_cache().path) + 3601):
+            _, requests = self.discover(self.get_cache(discovery_cache_ttl=3600))
+
+        self.assertEqual(requests, 1)
+
+    def test_refresh_discovers_again_and_updates_the_cache(self):
+        self.discover(self.get_cache())
+        _, requests = self.discover(self.get_cache(refresh_discovery_cache="true"))
+
+        self.assertEqual(requests, 1)
+        self.assertIsNotNone(self.get_cache().load())
+
+    def test_cache_is_keyed_by_api_key_and_revision(self):
+        path = self.get_cache().path
+
+        self.assertNotIn("pk_123", path)
+        self.assertNotEqual(path, self.get_cache(api_key="pk_456").path)
+        self.assertNotEqual(path, DiscoveryCache(self.directory.name, "pk_123", "2023-01-01").path)
+
+    def test_cache_is_disabled_without_directory(self):
+        self.assertIsNone(get_discovery_cache({"api_key": "pk_123"}, tap_klaviyo.API_VERSION))
+
+    def test_unreadable_cache_is_ignored(self):
+        discovery_cache = self.get_cache()
+        with open(discovery_cache.path, "w") as cache_file:
+            cache_file.write("{not json")
+
+        _, requests = self.discover(discovery_cache)
+
+        self.assertEqual(requests, 1)
+        self.assertIsNotNone(discovery_cache.load())
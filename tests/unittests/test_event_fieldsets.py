@@ -0,0 +1,59 @@
+import unittest
+
+import tap_klaviyo
+from singer import metadata
+from tap_klaviyo.utils import get_event_fieldsets, get_event_params, get_event_relationships
+
+
+def get_stream(metric_id, deselected=()):
+    stream = tap_klaviyo.Stream("receive", metric_id, ["id"], "INCREMENTAL", ["timestamp"]).to_catalog_dict()
+    mdata = metadata.to_map(stream["metadata"])
+    for field_name in deselected:
+        mdata = metadata.write(mdata, ("properties", field_name), "selected", False)
+    stream["metadata"] = metadata.to_list(mdata)
+    return stream
+
+
+class TestEventFieldsets(unittest.TestCase):
+
+    def test_all_fields_selected(self):
+        params = get_event_fieldsets([get_stream("M1")])
+
+        # The metric is attached locally
+        self.assertEqual(params["include"], "profile")
+        self.assertNotIn("fields[metric]", params)
+        self.assertEqual(params["fields[event]"], "timestamp,event_properties,datetime,uuid")
+        self.assertEqual(params["fields[profile]"].split(","), [
+            "email", "phone_number", "external_id", "first_name", "last_name", "organization", "title",
+            "image", "created", "updated", "last_event_date", "location", "properties"])
+
+    def test_deselected_relationship_is_not_included(self):
+        """Verify that a relationship is dropped from `include` when it is not selected"""
+        params = get_event_fieldsets([get_stream("M1", deselected=("profile", "uuid", "event_properties"))])
+
+        self.assertNotIn("include", params)
+        self.assertNotIn("fields[profile]", params)
+        self.assertEqual(params["fields[event]"], "timestamp,datetime")
+
+    def test_automatic_fields_cannot_be_deselected(self):
+        params = get_event_fieldsets([get_stream("M1", deselected=("timestamp", "profile", "metric"))])
+
+        self.assertNotIn("include", params)
+        self.assertIn("timestamp", params["fields[event]"].split(","))
+
+    def test_fields_are_merged_for_several_streams(self):
+        streams = [get_stream("M1", deselected=("profile",)), get_stream("M2", deselected=("metric",))]
+
+        self.assertEqual(get_event_fieldsets(streams)["include"], "profile")
+        self.assertEqual(get_event_relationships(streams), ["profile", "metric"])
+
+    def test_event_relationships(self):
+        self.assertEqual(get_event_relationships([get_stream("M1", deselected=("profile",))]), ["metric"])
+        self.assertEqual(get_event_relationships([get_stream("M1", deselected=("profile", "metric"))]), [])
+
+    def test_event_params(self):
+        params = get_event_params(get_stream("M1", deselected=("metric",)), 100, 200)
+
+        self.assertEqual(params["filter"], 'equals(metric_id,"M1"),greater-or-equal(timestamp,100),less-than(timestamp,200)')
+        self.assertEqual(params["include"], "profile")
+        self.assertEqual(params["sort"], "datetime")
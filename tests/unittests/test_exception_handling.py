@@ -1,5 +1,6 @@
 import tap_klaviyo.utils as utils_
 import unittest
+import json
 from unittest import mock
 import requests
 
@@ -21,7 +22,7 @@ class Mockresponse:
 def successful_200_request(*args, **kwargs):
     json_str = {"tap": "klaviyo", "code": 200}
 
-    return Mockresponse(200, json_str)
+    return Mockresponse(200, json_str, content=json.dumps(json_str).encode())
 
 def klaviyo_400_error(*args, **kwargs):
 
@@ -92,7 +93,7 @@ class TestBackoff(unittest.TestCase):
     def test_200(self, successful_200_request, mocked_get_request_timeout):
         test_data = {"tap": "klaviyo", "code": 200}
 
-        actual_data = utils_.authed_get("", "", "", "").json()
+        actual_data = utils_.authed_get("", "", "", "").body
         self.assertEqual(actual_data, test_data)
 
     @mock.patch('requests.Session.request', side_effect=klaviyo_400_error)
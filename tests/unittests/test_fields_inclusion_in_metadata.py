@@ -1,21 +1,16 @@
 import tap_klaviyo
 import unittest
 from unittest import mock
-from requests import Response
-import json
+from tap_klaviyo.utils import Page, INCREMENTAL_REPLICATION_KEYS
 
 
-def get_mock_http_response(status_code, contents):
-    contents = json.dumps(contents)
-    response = Response()
-    response.status_code = status_code
-    response._content = contents.encode()
-    return response
+def get_mock_page(status_code, contents):
+    return Page(contents, status_code)
 
 
 class TestFieldsInclusionInMetadata(unittest.TestCase):
     """
-    Test cases to verify inclusion value is available for fields in metadata and automatic for key_property
+    Test cases to verify inclusion value is available for fields in metadata and automatic for key_property and replication keys
     """
 
     @mock.patch("tap_klaviyo.get_all_using_next")
@@ -34,7 +29,7 @@ class TestFieldsInclusionInMetadata(unittest.TestCase):
         full_table_stream = ["global_exclusions", "lists", "campaigns"]
         bookmark_key = 'timestamp'
 
-        mock_get_all_using_next.return_value = [get_mock_http_response(
+        mock_get_all_using_next.return_value = [get_mock_page(
             200, {"data": streams})]
 
         # Get catalog
@@ -48,6 +43,9 @@ class TestFieldsInclusionInMetadata(unittest.TestCase):
             # Breadcrumbs of bookmark_key
             if catalog_entry['stream'] not in full_table_stream:
                 automatic_prop_breadcrumbs.add(('properties', bookmark_key))
+            else:
+                # Breadcrumbs of the replication key of the full table streams which may be synced incrementally
+                automatic_prop_breadcrumbs.add(('properties', INCREMENTAL_REPLICATION_KEYS[catalog_entry['stream']]))
 
             for field in catalog_entry['metadata']:
                 if field['breadcrumb'] in automatic_prop_breadcrumbs:
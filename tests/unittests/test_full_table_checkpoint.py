@@ -0,0 +1,152 @@
+import io
+import json
+import threading
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import tap_klaviyo
+import tap_klaviyo.utils as utils_
+from helpers import MockResponse, get_event_stream, get_full_table_stream
+
+ENDPOINT = "https://a.klaviyo.com/api/lists"
+NEXT_URL = ENDPOINT + "?page[cursor]=abc"
+
+
+def get_page(list_id, next_url=None):
+    return MockResponse({"data": [{"type": "list", "id": list_id, "attributes": {}}], "links": {"next": next_url}})
+
+
+class TestFullTableCheckpoint(unittest.TestCase):
+
+    def pull(self, state, responses, stream=None):
+        output = io.StringIO()
+        with mock.patch("requests.Session.request", side_effect=lambda **kwargs: responses[kwargs["url"]]), \
+                redirect_stdout(output):
+            utils_.get_full_pulls(stream or get_full_table_stream(), ENDPOINT, {}, state)
+        return [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_version_is_only_activated_once_the_stream_is_complete(self):
+        state = {}
+        messages = self.pull(state, {ENDPOINT: get_page("l1", NEXT_URL), NEXT_URL: get_page("l2")})
+
+        version = state["bookmarks"]["lists"]["version"]
+        self.assertEqual(state["bookmarks"]["lists"], {"version": version})
+        self.assertEqual([message["type"] for message in messages],
+                         ["RECORD", "STATE", "RECORD", "STATE", "ACTIVATE_VERSION", "STATE"])
+        self.assertEqual({message["version"] for message in messages if message["type"] != "STATE"}, {version})
+
+    def test_position_is_saved_after_each_page(self):
+        state = {"bookmarks": {"lists": {"version": 1}}}
+        messages = self.pull(state, {ENDPOINT: get_page("l1", NEXT_URL), NEXT_URL: get_page("l2")})
+
+        states = [message["value"]["bookmarks"]["lists"] for message in messages if message["type"] == "STATE"]
+        version = states[0]["version"]
+        self.assertNotEqual(version, 1)
+        self.assertEqual(states, [{"version": version, "params_count": 1, "completed_params": [],
+                                   "next_urls": {"0": NEXT_URL}},
+                                  {"version": version, "params_count": 1, "completed_params": [0], "next_urls": {}},
+                                  {"version": version}])
+        # the previous version stays visible until the new one is complete
+        self.assertEqual(messages[0]["type"], "RECORD")
+
+    def test_interrupted_sync_resumes_from_its_next_page_with_the_same_version(self):
+        state = {"bookmarks": {"lists": {"version": 5, "params_count": 1, "completed_params": [],
+                                         "next_urls": {"0": NEXT_URL}}}}
+        messages = self.pull(state, {NEXT_URL: get_page("l2")})
+
+        self.assertEqual([message["record"]["id"] for message in messages if message["type"] == "RECORD"], ["l2"])
+        self.assertEqual({message["version"] for message in messages if message["type"] != "STATE"}, {5})
+        self.assertEqual(state["bookmarks"]["lists"], {"version": 5})
+
+    def test_completed_params_sets_are_skipped(self):
+        stream = get_full_table_stream("global_exclusions")
+        requested = []
+        state = {"bookmarks": {"global_exclusions": {"version": 5, "params_count": 4, "completed_params": [0, 1],
+                                                     "next_urls": {}}}}
+
+        def request(**kwargs):
+            requested.append(kwargs["params"]["filter"])
+            return MockResponse({"data": [], "links": {}})
+
+        with mock.patch("requests.Session.request", side_effect=request), redirect_stdout(io.StringIO()):
+            utils_.get_full_pulls(stream, ENDPOINT, {}, state)
+
+        self.assertEqual(requested, [params["filter"] for params in utils_.STREAM_PARAMS_MAP["global_exclusions"][2:]])
+
+    def test_expired_next_page_restarts_the_params_set(self):
+        state = {"bookmarks": {"lists": {"version": 5, "params_count": 1, "completed_params": [],
+                                         "next_urls": {"0": NEXT_URL}}}}
+        messages = self.pull(state, {NEXT_URL: MockResponse({}, status_code=400), ENDPOINT: get_page("l1")})
+
+        self.assertEqual([message["record"]["id"] for message in messages if message["type"] == "RECORD"], ["l1"])
+        self.assertEqual(state["bookmarks"]["lists"], {"version": 5})
+
+    def test_full_table_bookmark_is_kept_by_the_metric_id_translation(self):
+        catalog = {"streams": [get_full_table_stream(), get_event_stream()]}
+        state = {"bookmarks": {"lists": {"version": 5}, "receive": {"since": "2023-01-01T00:00:00Z"}}}
+
+        state = tap_klaviyo.translate_stream_to_metric_id(state, catalog)
+
+        self.assertEqual(state["bookmarks"], {"lists": {"version": 5}, "M1": {"since": "2023-01-01T00:00:00Z"}})
+
+
+class TestConcurrentParamsSets(unittest.TestCase):
+
+    def tearDown(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({}))
+
+    def test_params_sets_are_paged_in_parallel(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({"max_concurrent_params_sets": 4}))
+        params_sets = utils_.STREAM_PARAMS_MAP["global_exclusions"]
+        # every params set waits for the others before returning its first page
+        barrier = threading.Barrier(len(params_sets), timeout=5)
+
+        def request(**kwargs):
+            if kwargs["url"] == ENDPOINT:
+                barrier.wait()
+                reason = params_sets.index(kwargs["params"])
+                return get_page("p{}".format(reason), "{}?reason={}".format(NEXT_URL, reason))
+            return get_page("q" + kwargs["url"][-1])
+
+        state = {}
+        output = io.StringIO()
+        with mock.patch("requests.Session.request", side_effect=request), redirect_stdout(output):
+            utils_.get_full_pulls(get_full_table_stream("global_exclusions"), ENDPOINT, {}, state)
+
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(sorted(message["record"]["id"] for message in messages if message["type"] == "RECORD"),
+                         ["p0", "p1", "p2", "p3", "q0", "q1", "q2", "q3"])
+        self.assertEqual(state["bookmarks"]["global_exclusions"], {"version": messages[0]["version"]})
+
+    def test_interrupted_params_sets_are_resumed_from_their_own_page(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({"max_concurrent_params_sets": 4}))
+        state = {"bookmarks": {"global_exclusions": {
+            "version": 5, "params_count": 4, "completed_params": [0, 2], "next_urls": {"1": NEXT_URL + "1", "3": NEXT_URL + "3"}}}}
+        requested = []
+
+        def request(**kwargs):
+            requested.append(kwargs["url"])
+            return get_page("p" + kwargs["url"][-1])
+
+        with mock.patch("requests.Session.request", side_effect=request), redirect_stdout(io.StringIO()):
+            utils_.get_full_pulls(get_full_table_stream("global_exclusions"), ENDPOINT, {}, state)
+
+        self.assertEqual(sorted(requested), [NEXT_URL + "1", NEXT_URL + "3"])
+        self.assertEqual(state["bookmarks"]["global_exclusions"], {"version": 5})
+
+    def test_failed_params_set_stops_the_stream(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({"max_concurrent_params_sets": 4}))
+
+        def request(**kwargs):
+            if "INVALID_EMAIL" in kwargs["params"]["filter"]:
+                return MockResponse({}, status_code=403)
+            return get_page("p1")
+
+        state = {}
+        with mock.patch("requests.Session.request", side_effect=request), redirect_stdout(io.StringIO()):
+            with self.assertRaises(utils_.KlaviyoForbiddenError):
+                utils_.get_full_pulls(get_full_table_stream("global_exclusions"), ENDPOINT, {}, state)
+
+        # the stream is resumed from the params sets which did not complete
+        self.assertNotIn(3, state["bookmarks"]["global_exclusions"]["completed_params"])
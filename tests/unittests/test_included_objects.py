@@ -0,0 +1,88 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+
+import tap_klaviyo.utils as utils_
+
+PROFILE = {"type": "profile", "id": "p1", "attributes": {"email": "a@b.c"}, "links": {"self": "url"}}
+
+STREAM = {
+    "stream": "receive",
+    "schema": {"type": "object", "properties": {
+        "id": {"type": ["null", "string"]},
+        "profile": {"type": ["null", "array"], "items": {"type": ["null", "object"], "properties": {
+            "type": {"type": ["null", "string"]},
+            "id": {"type": ["null", "string"]},
+            "email": {"type": ["null", "string"]},
+            "name": {"type": ["null", "string"]},
+        }}},
+    }},
+    "metadata": [],
+}
+
+
+def get_event(event_id, profile_type="profile"):
+    return {"type": "event", "id": event_id, "attributes": {},
+            "relationships": {"profile": {"data": {"type": profile_type, "id": "p1"}}}}
+
+
+class TestFlattenIncluded(unittest.TestCase):
+
+    def test_included_object_is_flattened_once_per_page(self):
+        included = utils_.Page({"included": [dict(PROFILE)]}).index_included()
+        self.assertEqual(included[("profile", "p1")]["email"], "a@b.c")
+        self.assertEqual(included[("profile", "p1")]["attributes"], {"email": "a@b.c"})
+
+    def test_pages_do_not_share_their_objects(self):
+        first = utils_.Page({"included": [dict(PROFILE)]}).index_included()[("profile", "p1")]
+        second = utils_.Page({"included": [dict(PROFILE)]}).index_included()[("profile", "p1")]
+        self.assertIsNot(first, second)
+
+
+class TestResolveRelationships(unittest.TestCase):
+
+    def write_page(self, events, included):
+        page = utils_.Page({"data": events, "included": included})
+        output = io.StringIO()
+        with redirect_stdout(output):
+            utils_.transfrom_and_write_records(page.data, STREAM, page.index_included(), ["profile"])
+            utils_.flush_output()
+        return [json.loads(line)["record"] for line in output.getvalue().splitlines()]
+
+    def test_events_share_the_included_profile(self):
+        records = self.write_page([get_event("e1"), get_event("e2")], [dict(PROFILE)])
+        expected_profile = [{"type": "profile", "id": "p1", "email": "a@b.c"}]
+        self.assertEqual(records, [{"id": "e1", "profile": expected_profile},
+                                   {"id": "e2", "profile": expected_profile}])
+
+    def test_included_objects_are_matched_by_type(self):
+        other = {"type": "list", "id": "p1", "attributes": {"name": "list"}}
+        records = self.write_page([get_event("e1"), get_event("e2", "list")], [dict(PROFILE), other])
+        self.assertEqual(records[0]["profile"][0]["email"], "a@b.c")
+        self.assertEqual(records[1]["profile"][0]["name"], "list")
+
+    def test_missing_included_object_is_left_unresolved(self):
+        records = self.write_page([get_event("e1")], [])
+        self.assertEqual(records[0]["profile"], [{"type": "profile", "id": "p1"}])
+
+    def test_relationship_with_extra_fields_is_merged(self):
+        included = utils_.Page({"included": [dict(PROFILE)]}).index_included()
+        relationship = {"type": "profile", "id": "p1", "meta": {"a": 1}}
+        resolved = utils_.resolve_relationship(relationship, included)
+        self.assertEqual(resolved["meta"], {"a": 1})
+        self.assertEqual(resolved["email"], "a@b.c")
+        self.assertNotIn("meta", included[("profile", "p1")])
+
+    def test_nested_deselection_does_not_change_the_shared_object(self):
+        stream = {**STREAM, "metadata": [
+            {"breadcrumb": ["properties", "profile", "items", "properties", "email"], "metadata": {"selected": False}}]}
+        page = utils_.Page({"data": [get_event("e1")], "included": [dict(PROFILE)]})
+        included = page.index_included()
+        output = io.StringIO()
+        with redirect_stdout(output):
+            utils_.transfrom_and_write_records(page.data, stream, included, ["profile"])
+            utils_.flush_output()
+
+        # the profile is still complete for the records of the other streams
+        self.assertEqual(included[("profile", "p1")]["email"], "a@b.c")
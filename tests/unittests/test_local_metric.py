@@ -0,0 +1,114 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import tap_klaviyo
+import tap_klaviyo.utils as utils_
+from tap_klaviyo import streaming
+from helpers import MockResponse, get_event_stream
+
+EVENTS_URL = "https://a.klaviyo.com/api/events"
+
+METRIC = {"type": "metric", "id": "M1", "links": {"self": "https://a.klaviyo.com/api/metrics/M1"},
+          "attributes": {"name": "Received Email", "created": "2020-01-01T00:00:00+00:00",
+                         "updated": "2020-01-01T00:00:00+00:00", "integration": {"name": "Klaviyo"}}}
+
+EVENT = {"type": "event", "id": "e1",
+         "attributes": {"timestamp": 1700000000, "datetime": "2023-11-14T22:13:20+00:00"},
+         "relationships": {"metric": {"data": {"type": "metric", "id": "M1"}}}}
+
+
+def mocked_request(method, url, params, headers, timeout):
+    if url.startswith("https://a.klaviyo.com/api/metrics/"):
+        return MockResponse({"data": METRIC})
+    return MockResponse({"data": [dict(EVENT)], "links": {"next": None}})
+
+
+def get_records(output):
+    return [message["record"] for message in map(json.loads, output.getvalue().splitlines())
+            if message["type"] == "RECORD"]
+
+
+@mock.patch.dict(utils_.metric_cache, clear=True)
+class TestLocalMetric(unittest.TestCase):
+
+    def pull(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            utils_.get_incremental_pull(get_event_stream(), EVENTS_URL, {"bookmarks": {}}, {}, "2023-01-01T00:00:00Z")
+        return get_records(output)
+
+    @mock.patch("requests.Session.request", side_effect=mocked_request)
+    def test_metric_is_requested_once_and_attached(self, mocked_session_request):
+        records = self.pull() + self.pull()
+
+        urls = [call[1]["url"] for call in mocked_session_request.call_args_list]
+        self.assertEqual(urls, [EVENTS_URL, "https://a.klaviyo.com/api/metrics/M1", EVENTS_URL])
+        self.assertEqual(mocked_session_request.call_args_list[1][1]["params"],
+                         {"fields[metric]": "name,created,updated,integration"})
+        self.assertNotIn("metric", mocked_session_request.call_args_list[0][1]["params"]["include"])
+        # Same record as when the metric was part of `included`
+        self.assertEqual(records[0]["metric"], [{"type": "metric", "id": "M1", "name": "Received Email",
+                                                 "created": "2020-01-01T00:00:00.000000Z",
+                                                 "updated": "2020-01-01T00:00:00.000000Z",
+                                                 "integration": {"name": "Klaviyo"}}])
+
+    @mock.patch("requests.Session.request")
+    def test_missing_metric_is_left_unresolved(self, mocked_session_request):
+        mocked_session_request.side_effect = [MockResponse({"data": [dict(EVENT)], "links": {"next": None}}),
+                                              MockResponse({"errors": []}, status_code=404)]
+
+        records = self.pull()
+
+        self.assertEqual(records[0]["metric"], [{"type": "metric", "id": "M1"}])
+
+    @mock.patch("tap_klaviyo.get_all_using_next", return_value=[utils_.Page({"data": [METRIC]})])
+    @mock.patch("requests.Session.request", side_effect=mocked_request)
+    def test_metrics_of_the_discovery_are_reused(self, mocked_session_request, mocked_get_all_using_next):
+        tap_klaviyo.get_available_metrics({})
+
+        records = self.pull()
+
+        self.assertEqual([call[1]["url"] for call in mocked_session_request.call_args_list], [EVENTS_URL])
+        self.assertEqual(records[0]["metric"][0]["name"], "Received Email")
+
+    @mock.patch("requests.Session.request", return_value=MockResponse({"data": [], "links": {"next": None}}))
+    def test_metric_is_not_requested_without_events(self, mocked_session_request):
+        records = self.pull()
+
+        self.assertEqual(records, [])
+        self.assertEqual([call[1]["url"] for call in mocked_session_request.call_args_list], [EVENTS_URL])
+
+    @mock.patch("requests.Session.request", return_value=MockResponse({"data": [], "links": {"next": None}}))
+    def test_multiplexed_streams_without_events_send_only_the_events_request(self, mocked_session_request):
+        streams = [get_event_stream(stream_name, "M{}".format(index))
+                   for index, stream_name in enumerate(["receive", "click", "open", "bounce", "dropped_email"])]
+        state = {"bookmarks": {stream["tap_stream_id"]: {"since": "2024-01-01T00:00:00Z"} for stream in streams}}
+
+        with redirect_stdout(io.StringIO()):
+            utils_.get_multiplexed_incremental_pull(streams, EVENTS_URL, state, {}, "2023-01-01T00:00:00Z")
+
+        self.assertEqual([call[1]["url"] for call in mocked_session_request.call_args_list], [EVENTS_URL])
+
+    @unittest.skipIf(streaming.ijson is None, "ijson is not installed")
+    @mock.patch("requests.Session.request")
+    def test_streamed_pull_requests_the_metric_with_the_first_events(self, mocked_session_request):
+        def request(**kwargs):
+            if kwargs["url"].startswith("https://a.klaviyo.com/api/metrics/"):
+                return MockResponse({"data": METRIC})
+            response = MockResponse({"data": [dict(EVENT)], "links": {"next": None}})
+            response.raw = io.BytesIO(response.content)
+            response.close = lambda: None
+            return response
+        mocked_session_request.side_effect = request
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({"streaming_parse": True}))
+        try:
+            records = self.pull()
+        finally:
+            utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({}))
+
+        self.assertEqual([call[1]["url"] for call in mocked_session_request.call_args_list],
+                         [EVENTS_URL, "https://a.klaviyo.com/api/metrics/M1"])
+        self.assertEqual(records[0]["metric"][0]["name"], "Received Email")
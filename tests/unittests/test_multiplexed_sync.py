@@ -0,0 +1,76 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import tap_klaviyo
+import tap_klaviyo.utils as utils_
+from helpers import MockResponse, get_event_stream
+
+START = 1700000000
+
+
+def get_event(event_id, metric_id, timestamp):
+    return {"type": "event", "id": event_id, "attributes": {"timestamp": timestamp},
+            "relationships": {"metric": {"data": {"type": "metric", "id": metric_id}}}}
+
+
+class TestMultiplexedSync(unittest.TestCase):
+
+    def tearDown(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({}))
+
+    @mock.patch.dict(utils_.metric_cache, clear=True)
+    @mock.patch("requests.Session.request")
+    def test_events_are_routed_to_their_stream(self, mocked_request):
+        """Verify that one query serves both metrics and every stream keeps its own bookmark"""
+        mocked_request.return_value = MockResponse({"data": [
+            get_event("a1", "A", START + 10),
+            # before the bookmark of stream B, already synced
+            get_event("b1", "B", START + 20),
+            get_event("b2", "B", START + 200),
+            get_event("a2", "A", START + 300),
+        ], "links": {}})
+        streams = [get_event_stream("receive", "A", selected=True), get_event_stream("click", "B", selected=True)]
+        state = {"bookmarks": {"A": {"since": utils_.ts_to_dt(START)},
+                               "B": {"since": utils_.ts_to_dt(START + 100)}}}
+        # Loaded during the discovery
+        for metric_id in ("A", "B"):
+            utils_.cache_metric({"type": "metric", "id": metric_id, "attributes": {"name": metric_id}})
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            utils_.get_multiplexed_incremental_pull(streams, "https://a.klaviyo.com/api/events", state, {}, None)
+
+        self.assertEqual(mocked_request.call_count, 1)
+        self.assertEqual(mocked_request.call_args[1]["params"]["filter"],
+                         f'any(metric_id,["A","B"]),greater-or-equal(timestamp,{START})')
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+        records = [(message["stream"], message["record"]["id"]) for message in messages if message["type"] == "RECORD"]
+        self.assertEqual(sorted(records), [("click", "b2"), ("receive", "a1"), ("receive", "a2")])
+        metrics = {message["record"]["id"]: message["record"]["metric"][0]["name"]
+                   for message in messages if message["type"] == "RECORD"}
+        self.assertEqual(metrics, {"a1": "A", "a2": "A", "b2": "B"})
+        self.assertEqual(state["bookmarks"]["A"]["since"], utils_.ts_to_dt(START + 299))
+        self.assertEqual(state["bookmarks"]["B"]["since"], utils_.ts_to_dt(START + 199))
+
+    def test_only_bookmarked_streams_are_multiplexed(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({"multiplex_metric_streams": "true"}))
+        streams = [get_event_stream("receive", "A", selected=True), get_event_stream("click", "B", selected=True),
+                   get_event_stream("open", "C", selected=True)]
+        state = {"bookmarks": {"A": {"since": "2023-01-01T00:00:00Z"}, "B": {"since": "2023-01-01T00:00:00Z"}}}
+
+        jobs = tap_klaviyo.get_sync_jobs(streams, state, {}, None)
+
+        self.assertEqual([job.func for job in jobs], [tap_klaviyo.sync_multiplexed_streams, tap_klaviyo.sync_stream])
+        self.assertEqual(jobs[0].args[0], streams[:2])
+        self.assertEqual(jobs[1].args[0], streams[2])
+
+    def test_multiplexing_disabled_by_default(self):
+        streams = [get_event_stream("receive", "A", selected=True), get_event_stream("click", "B", selected=True)]
+        state = {"bookmarks": {"A": {"since": "2023-01-01T00:00:00Z"}, "B": {"since": "2023-01-01T00:00:00Z"}}}
+
+        jobs = tap_klaviyo.get_sync_jobs(streams, state, {}, None)
+
+        self.assertEqual([job.func for job in jobs], [tap_klaviyo.sync_stream, tap_klaviyo.sync_stream])
@@ -1,4 +1,5 @@
 import unittest
+import json
 from unittest import mock
 import singer
 from tap_klaviyo.utils import transfrom_and_write_records
@@ -22,7 +23,7 @@ class MockResponse:
 def successful_200_request(*args, **kwargs):
     json_str = {"data": [{"type": "metric", "id": "abc", "attributes": {"name": "abc", "created": "2019-09-09T19:06:57+00:00", "updated": "2019-09-09T19:06:57+00:00", "integration": {"object": "integration", "id": "abc"}}}],"links": {"self": "abc", "next": None, "previous": None}}
 
-    return MockResponse(200, json_str)
+    return MockResponse(200, json_str, content=json.dumps(json_str).encode())
 
 class MockParseArgs():
     """
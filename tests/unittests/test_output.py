@@ -0,0 +1,89 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import tap_klaviyo
+import tap_klaviyo.utils as utils_
+from tap_klaviyo.output import MessageBuffer
+
+
+class CountingStdout(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, s):
+        self.writes += 1
+        return super().write(s)
+
+
+def get_messages(output):
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+class TestMessageBuffer(unittest.TestCase):
+
+    def test_flushes_on_size(self):
+        buffer = MessageBuffer(max_size=10, max_interval=60)
+        output = CountingStdout()
+        with redirect_stdout(output):
+            buffer.write("12345\n")
+            self.assertEqual(output.getvalue(), "")
+            buffer.write("67890\n")
+        self.assertEqual(output.getvalue(), "12345\n67890\n")
+        self.assertEqual(output.writes, 1)
+
+    @mock.patch("tap_klaviyo.output.time.monotonic")
+    def test_flushes_on_interval(self, mocked_monotonic):
+        mocked_monotonic.return_value = 100
+        buffer = MessageBuffer(max_size=1000, max_interval=5)
+        output = CountingStdout()
+        with redirect_stdout(output):
+            buffer.write("1\n")
+            self.assertEqual(output.getvalue(), "")
+            mocked_monotonic.return_value = 105
+            buffer.write("2\n")
+        self.assertEqual(output.getvalue(), "1\n2\n")
+
+
+class TestBufferedMessages(unittest.TestCase):
+
+    def setUp(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({"json_backend": "simplejson"}))
+
+    def tearDown(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({}))
+
+    def test_page_is_written_at_once(self):
+        stream = {"stream": "lists", "schema": {}, "metadata": []}
+        records = [{"id": str(i), "attributes": {}} for i in range(20)]
+        output = CountingStdout()
+        with redirect_stdout(output):
+            utils_.transfrom_and_write_records(records, stream, {}, [])
+            utils_.flush_output()
+        self.assertEqual(output.writes, 1)
+        self.assertEqual([message["record"]["id"] for message in get_messages(output)],
+                         [str(i) for i in range(20)])
+
+    def test_records_are_written_before_state(self):
+        stream = {"stream": "lists", "schema": {}, "metadata": [], "key_properties": ["id"]}
+        output = io.StringIO()
+        with redirect_stdout(output):
+            utils_.write_schema(stream)
+            utils_.write_records("lists", [{"id": "1"}])
+            utils_.write_state({"bookmarks": {"lists": "1"}})
+            utils_.write_records("lists", [{"id": "2"}])
+            utils_.flush_output()
+        self.assertEqual([message["type"] for message in get_messages(output)],
+                         ["SCHEMA", "RECORD", "STATE", "RECORD"])
+
+    @mock.patch("tap_klaviyo.get_full_pulls")
+    def test_sync_stream_flushes_at_the_end(self, mocked_get_full_pulls):
+        stream = {"stream": "lists", "schema": {}, "metadata": [], "key_properties": ["id"]}
+        mocked_get_full_pulls.side_effect = lambda *args: utils_.write_records("lists", [{"id": "1"}])
+        output = io.StringIO()
+        with redirect_stdout(output):
+            tap_klaviyo.sync_stream(stream, {}, {}, None)
+        self.assertEqual([message["type"] for message in get_messages(output)], ["SCHEMA", "RECORD"])
@@ -0,0 +1,41 @@
+import unittest
+from unittest import mock
+
+import tap_klaviyo.utils as utils_
+from helpers import MockResponse
+
+
+class CountingResponse(MockResponse):
+    def __init__(self, resp):
+        super().__init__(resp)
+        self.decode_calls = 0
+
+    @property
+    def content(self):
+        self.decode_calls += 1
+        return super().content
+
+    def json(self):
+        self.decode_calls += 1
+        return super().json()
+
+
+class TestPage(unittest.TestCase):
+
+    def test_pages_are_decoded_once(self):
+        """Verify that pagination follows `links.next` and decodes every response only once"""
+        responses = [
+            CountingResponse({"data": [{"id": "1"}], "included": [{"id": "p1"}], "links": {"next": "https://next"}}),
+            CountingResponse({"data": [{"id": "2"}], "links": {"next": None}}),
+        ]
+        with mock.patch("requests.Session.request", side_effect=responses) as mocked_request:
+            pages = list(utils_.get_all_using_next("events", "https://first", {}, {"filter": "x"}))
+
+        self.assertEqual([page.data for page in pages], [[{"id": "1"}], [{"id": "2"}]])
+        self.assertEqual(pages[0].next_url, "https://next")
+        self.assertEqual(pages[0].index_included(), {(None, "p1"): {"id": "p1"}})
+        self.assertEqual(pages[1].included, [])
+        self.assertIsNone(pages[1].next_url)
+        self.assertEqual([response.decode_calls for response in responses], [1, 1])
+        # params are only sent with the first request, the next url already carries them
+        self.assertEqual(mocked_request.call_args_list[1][1]["params"], {})
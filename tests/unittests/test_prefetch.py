@@ -0,0 +1,68 @@
+import threading
+import unittest
+from unittest import mock
+
+import tap_klaviyo.utils as utils_
+
+
+def get_page(index, last):
+    return utils_.Page({"data": [{"id": str(index)}], "links": {"next": None if last else f"page-{index + 1}"}})
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def tearDown(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({}))
+
+    @mock.patch("tap_klaviyo.utils.authed_get")
+    def test_pages_are_yielded_in_order(self, mocked_authed_get):
+        """Verify that prefetching yields the same pages in the same order"""
+        mocked_authed_get.side_effect = [get_page(index, index == 4) for index in range(5)]
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({"prefetch_pages": 2}))
+
+        pages = list(utils_.get_all_using_next("events", "page-0", {}, {"filter": "x"}))
+
+        self.assertEqual([page.data[0]["id"] for page in pages], ["0", "1", "2", "3", "4"])
+        self.assertEqual([call[0][1] for call in mocked_authed_get.call_args_list],
+                         ["page-0", "page-1", "page-2", "page-3", "page-4"])
+
+    @mock.patch("tap_klaviyo.utils.authed_get")
+    def test_next_page_is_fetched_while_current_page_is_processed(self, mocked_authed_get):
+        """Verify that the second page is requested before the consumer is done with the first one"""
+        second_page_requested = threading.Event()
+
+        def get(stream, url, params, headers, streamed=False):
+            if url == "page-1":
+                second_page_requested.set()
+            return get_page(int(url.split("-")[1]), url == "page-1")
+        mocked_authed_get.side_effect = get
+
+        pages = utils_.get_all_using_next_prefetched("events", "page-0", {}, {}, 1)
+        next(pages)
+        self.assertTrue(second_page_requested.wait(5))
+        self.assertEqual(len(list(pages)), 1)
+
+    @mock.patch("tap_klaviyo.utils.authed_get")
+    def test_error_is_raised_in_consumer(self, mocked_authed_get):
+        mocked_authed_get.side_effect = [get_page(0, False), utils_.KlaviyoBadRequestError("bad")]
+
+        pages = utils_.get_all_using_next_prefetched("events", "page-0", {}, {}, 2)
+
+        self.assertEqual(next(pages).data[0]["id"], "0")
+        with self.assertRaises(utils_.KlaviyoBadRequestError):
+            next(pages)
+
+    @mock.patch("tap_klaviyo.utils.authed_get")
+    def test_closing_stops_fetching(self, mocked_authed_get):
+        """Verify that the background thread stops paginating once the consumer is closed"""
+        mocked_authed_get.side_effect = lambda stream, url, params, headers, streamed=False: get_page(int(url.split("-")[1]), False)
+
+        pages = utils_.get_all_using_next_prefetched("events", "page-0", {}, {}, 1)
+        next(pages)
+        pages.close()
+        for thread in threading.enumerate():
+            if thread.name == "prefetch-events":
+                thread.join(5)
+                self.assertFalse(thread.is_alive())
+        calls = mocked_authed_get.call_count
+        self.assertLessEqual(calls, 3)
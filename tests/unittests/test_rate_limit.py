@@ -0,0 +1,88 @@
+import unittest
+from unittest import mock
+
+import tap_klaviyo.utils as utils_
+from tap_klaviyo.rate_limit import RateLimiter, TokenBucket, parse_limit_policies, get_endpoint_key
+from helpers import MockResponse
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_token_bucket_paces_after_burst(self):
+        """Verify that the bucket allows `capacity` requests and then spaces them by the refill rate"""
+        bucket = TokenBucket(2, 1)
+        now = bucket.updated
+
+        self.assertEqual(bucket.reserve(now), 0)
+        self.assertEqual(bucket.reserve(now), 0)
+        self.assertAlmostEqual(bucket.reserve(now), 0.5)
+        self.assertAlmostEqual(bucket.reserve(now), 1.0)
+
+    def test_parse_limit_policies(self):
+        self.assertEqual(parse_limit_policies("10, 10;w=1, 150;w=60"), (10, {1: 10, 60: 150}))
+        self.assertEqual(parse_limit_policies(None), (None, {}))
+
+    def test_endpoint_key(self):
+        """Verify that a resource url shares the budget of its collection endpoint"""
+        self.assertEqual(get_endpoint_key("https://a.klaviyo.com/api/metrics/abc"), "/api/metrics")
+        self.assertEqual(get_endpoint_key("https://a.klaviyo.com/api/events?page[cursor]=x"), "/api/events")
+
+    def test_documented_limits_are_scaled(self):
+        """Verify that the documented limits are used with the configured fraction"""
+        limiter = RateLimiter(fraction=0.5)
+        endpoint = limiter.get_endpoint("https://a.klaviyo.com/api/events")
+
+        self.assertEqual({window: bucket.capacity for window, bucket in endpoint.buckets.items()},
+                         {1: 175, 60: 1750})
+
+    def test_headers_update_budget(self):
+        """Verify that the limits and remaining budget reported by Klaviyo are applied"""
+        limiter = RateLimiter()
+        url = "https://a.klaviyo.com/api/campaigns"
+        limiter.record(url, 200, {"RateLimit-Limit": "3, 3;w=1, 60;w=60", "RateLimit-Remaining": "1"})
+        endpoint = limiter.get_endpoint(url)
+
+        self.assertEqual(endpoint.buckets[1].capacity, 3)
+        self.assertEqual(endpoint.buckets[60].capacity, 60)
+        self.assertLessEqual(endpoint.buckets[1].tokens, 1)
+
+    def test_exhausted_budget_blocks_until_reset(self):
+        limiter = RateLimiter()
+        url = "https://a.klaviyo.com/api/campaigns"
+        limiter.record(url, 200, {"RateLimit-Remaining": "0", "RateLimit-Reset": "7"})
+
+        self.assertAlmostEqual(limiter.reserve(url), 7, places=1)
+
+    def test_unknown_endpoint_is_not_paced(self):
+        limiter = RateLimiter()
+        delays = [limiter.reserve("https://a.klaviyo.com/api/unknown") for _ in range(100)]
+
+        self.assertEqual(max(delays), 0)
+
+
+@mock.patch("time.sleep")
+class TestRetryAfter(unittest.TestCase):
+
+    def tearDown(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({}))
+
+    def test_retry_after_is_respected(self, mocked_sleep):
+        """Verify that a 429 waits for `Retry-After` through the rate limiter instead of a blind backoff"""
+        url = "https://a.klaviyo.com/api/campaigns"
+        responses = [MockResponse(status_code=429, headers={"Retry-After": "12"}),
+                     MockResponse({"data": [], "links": {}})]
+        with mock.patch("requests.Session.request", side_effect=responses) as mocked_request:
+            page = utils_.authed_get("campaigns", url, {}, {})
+
+        self.assertEqual(page.data, [])
+        self.assertEqual(mocked_request.call_count, 2)
+        waits = [call[0][0] for call in mocked_sleep.call_args_list if call[0][0] > 0]
+        # the retry waits for `Retry-After` and the backoff itself does not add a wait
+        self.assertEqual(len(waits), 1)
+        self.assertAlmostEqual(waits[0], 12, places=1)
+
+    def test_rate_limit_error_carries_retry_after(self, mocked_sleep):
+        with self.assertRaises(utils_.KlaviyoRateLimitError) as e:
+            utils_.raise_for_error(MockResponse(status_code=429), retry_after=5)
+
+        self.assertEqual(e.exception.retry_after, 5)
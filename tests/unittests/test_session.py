@@ -0,0 +1,62 @@
+import unittest
+from unittest import mock
+from requests.adapters import HTTPAdapter
+
+import tap_klaviyo.utils as utils_
+
+
+class MockPool:
+    def __init__(self, num_requests, num_connections):
+        self.num_requests = num_requests
+        self.num_connections = num_connections
+
+
+class TestSession(unittest.TestCase):
+
+    def tearDown(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({}))
+
+    def test_build_session_mounts_pooled_adapter(self):
+        """Verify that the session mounts one keep-alive adapter sized from the arguments"""
+        session = utils_.build_session(pool_size=25, connection_retries=2)
+        adapter = session.get_adapter("https://a.klaviyo.com/api/events")
+
+        self.assertIsInstance(adapter, HTTPAdapter)
+        self.assertEqual(adapter._pool_maxsize, 25)
+        self.assertEqual(adapter.max_retries.connect, 2)
+        # read errors and status codes are retried by backoff, not by the adapter
+        self.assertEqual(adapter.max_retries.read, 0)
+        self.assertEqual(adapter.max_retries.status, 0)
+        self.assertEqual(session.headers['Connection'], 'keep-alive')
+
+    def test_session_sized_from_runtime_settings(self):
+        """Verify that the shared session is replaced with one sized from the config"""
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({"pool_size": "4", "connection_retries": 0}))
+        adapter = utils_.session.get_adapter("https://a.klaviyo.com/api/events")
+
+        self.assertEqual(adapter._pool_maxsize, 4)
+        # 0 disables the retries of the connections
+        self.assertEqual(adapter.max_retries.connect, 0)
+
+    def test_connection_retries_default(self):
+        for config in ({}, {"connection_retries": ""}, {"connection_retries": -1}):
+            utils_.set_runtime_settings(utils_.RuntimeSettings.from_config(config))
+            self.assertEqual(utils_.session.get_adapter("https://a.klaviyo.com/api/events").max_retries.connect,
+                             utils_.CONNECTION_RETRIES)
+
+    def test_authed_get_uses_shared_session(self):
+        """Verify that `authed_get` sends the request through the shared session"""
+        mock_resp = mock.Mock(status_code=200, content=b'{"data": []}')
+        with mock.patch.object(utils_.session, "request", return_value=mock_resp) as mocked_request:
+            utils_.authed_get("events", "https://a.klaviyo.com/api/events", {}, {})
+
+        mocked_request.assert_called_once_with(method='get', url="https://a.klaviyo.com/api/events",
+                                               params={}, headers={}, timeout=300)
+
+    def test_connection_stats(self):
+        """Verify that reused connections are counted from the pool counters"""
+        adapter = utils_.session.get_adapter("https://a.klaviyo.com")
+        with mock.patch.object(adapter.poolmanager, "pools", {"klaviyo": MockPool(10, 2)}):
+            stats = utils_.get_connection_stats()
+
+        self.assertEqual(stats, {"requests": 10, "new_connections": 2, "reused_connections": 8})
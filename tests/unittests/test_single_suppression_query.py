@@ -0,0 +1,104 @@
+import io
+import json
+import re
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import tap_klaviyo
+import tap_klaviyo.utils as utils_
+from helpers import MockResponse
+
+ENDPOINT = "https://a.klaviyo.com/api/profiles"
+NEXT_URL = ENDPOINT + "?page[cursor]=2"
+
+
+def get_profile(profile_id, *reasons):
+    return {
+        "type": "profile",
+        "id": profile_id,
+        "attributes": {
+            "email": "{}@example.com".format(profile_id),
+            "updated": "2024-01-0{}T00:00:00+00:00".format(len(profile_id)),
+            "subscriptions": {"email": {"marketing": {
+                "can_receive_email_marketing": False,
+                "suppression": [{"reason": reason, "timestamp": "2023-06-01T00:00:00+00:00"} for reason in reasons]
+            }}}
+        }
+    }
+
+
+# Profiles as returned by the profiles endpoint with `additional-fields[profile]=subscriptions`
+PROFILES = [
+    get_profile("p1", "HARD_BOUNCE"),
+    get_profile("p2", "USER_SUPPRESSED"),
+    get_profile("p3", "UNSUBSCRIBE", "HARD_BOUNCE"),
+    get_profile("p4", "INVALID_EMAIL"),
+    get_profile("p5", "SPAM_COMPLAINT"),
+    get_profile("p6"),
+]
+
+
+def get_reasons(profile):
+    return [suppression["reason"]
+            for suppression in profile["attributes"]["subscriptions"]["email"]["marketing"]["suppression"]]
+
+
+def request(**kwargs):
+    """Filter the profiles like the API does for the `equals` and `any` suppression reason filters"""
+    if kwargs["url"] == NEXT_URL:
+        # profiles which are not suppressed for one of the reasons are also returned to verify they are not written
+        return MockResponse({"data": PROFILES[3:], "links": {"next": None}})
+    match = re.match(r"(equals|any)\(subscriptions\.email\.marketing\.suppression\.reason,\[?(.*?)\]?\)$",
+                     kwargs["params"]["filter"])
+    reasons = re.findall(r"'(\w+)'", match.group(2))
+    if match.group(1) == "any":
+        return MockResponse({"data": PROFILES[:3], "links": {"next": NEXT_URL}})
+    return MockResponse({"data": [profile for profile in PROFILES if set(get_reasons(profile)) & set(reasons)],
+                         "links": {"next": None}})
+
+
+class TestSingleSuppressionQuery(unittest.TestCase):
+
+    def tearDown(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({}))
+
+    def sync(self, config, state=None):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config(config))
+        stream = tap_klaviyo.GLOBAL_EXCLUSIONS.to_catalog_dict()
+        output = io.StringIO()
+        with mock.patch("requests.Session.request", side_effect=request) as mocked_request, \
+                redirect_stdout(output):
+            utils_.get_full_pulls(stream, ENDPOINT, {}, {} if state is None else state)
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+        return [message["record"] for message in messages if message["type"] == "RECORD"], mocked_request
+
+    def test_records_are_identical_to_the_four_queries(self):
+        four_pass_records, four_pass_requests = self.sync({})
+        single_records, single_requests = self.sync({"single_suppression_query": True})
+
+        self.assertEqual(four_pass_requests.call_count, 4)
+        self.assertEqual(single_requests.call_count, 2)
+        # profiles with several reasons are written once per query by the four pass version
+        self.assertEqual(len(four_pass_records), 5)
+        self.assertEqual({record["id"]: record for record in single_records},
+                         {record["id"]: record for record in four_pass_records})
+        self.assertEqual(sorted(record["id"] for record in single_records), ["p1", "p2", "p3", "p4"])
+
+    def test_single_query_matches_every_reason(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({"single_suppression_query": True}))
+
+        self.assertEqual(utils_.get_stream_params("global_exclusions"), [{
+            "filter": "any(subscriptions.email.marketing.suppression.reason,"
+                      "['HARD_BOUNCE','USER_SUPPRESSED','UNSUBSCRIBE','INVALID_EMAIL'])",
+            "additional-fields[profile]": "subscriptions,predictive_analytics"
+        }])
+        self.assertEqual(utils_.get_stream_params("lists"), utils_.STREAM_PARAMS_MAP["lists"])
+
+    def test_position_of_the_four_queries_is_not_resumed(self):
+        state = {"bookmarks": {"global_exclusions": {"version": 5, "params_count": 4, "completed_params": [0],
+                                                     "next_urls": {"1": ENDPOINT + "?page[cursor]=x"}}}}
+        records, _ = self.sync({"single_suppression_query": True}, state)
+
+        self.assertEqual(sorted(record["id"] for record in records), ["p1", "p2", "p3", "p4"])
+        self.assertNotEqual(state["bookmarks"]["global_exclusions"]["version"], 5)
@@ -0,0 +1,71 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import tap_klaviyo.utils as utils_
+from helpers import MockResponse, get_event_stream
+
+START = 1700000000
+
+
+def get_pages(count):
+    return [MockResponse({"data": [{"type": "event", "id": str(index), "attributes": {"timestamp": START + index}}],
+                          "links": {"next": f"https://next/{index + 1}" if index + 1 < count else None}})
+            for index in range(count)]
+
+
+def get_stream():
+    stream = get_event_stream()
+    stream["metadata"] = [{"breadcrumb": ["properties", "metric"], "metadata": {"selected": False}}]
+    return stream
+
+
+@mock.patch("requests.Session.request")
+class TestStateCheckpoint(unittest.TestCase):
+
+    def tearDown(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({}))
+
+    def pull(self, config):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config(config))
+        output = io.StringIO()
+        with redirect_stdout(output):
+            try:
+                utils_.get_incremental_pull(get_stream(), "https://a.klaviyo.com/api/events", {"bookmarks": {}}, {},
+                                            "2023-01-01T00:00:00Z")
+            finally:
+                messages = [json.loads(line) for line in output.getvalue().splitlines()]
+                self.states = [message["value"]["bookmarks"]["M1"]["since"]
+                               for message in messages if message["type"] == "STATE"]
+
+    def test_state_after_every_page_by_default(self, mocked_request):
+        mocked_request.side_effect = get_pages(4)
+        self.pull({})
+        self.assertEqual(self.states, [utils_.ts_to_dt(START + index - 1) for index in range(4)])
+
+    def test_state_every_n_pages_and_at_the_end(self, mocked_request):
+        mocked_request.side_effect = get_pages(7)
+        self.pull({"state_emit_interval_pages": 3})
+        self.assertEqual(self.states, [utils_.ts_to_dt(START + index - 1) for index in (2, 5, 6)])
+
+    @mock.patch("tap_klaviyo.utils.write_state")
+    @mock.patch("time.monotonic")
+    def test_state_every_n_seconds(self, mocked_monotonic, mocked_write_state, mocked_request):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({"state_emit_interval_seconds": 25}))
+        mocked_monotonic.return_value = 0
+        with utils_.StateCheckpoint({}) as checkpoint:
+            # a page every 10 seconds
+            for index in range(1, 8):
+                mocked_monotonic.return_value = 10 * index
+                checkpoint.page_done()
+            self.assertEqual(mocked_write_state.call_count, 2)
+        # the last page is written when the stream ends
+        self.assertEqual(mocked_write_state.call_count, 3)
+
+    def test_pending_state_is_written_on_error(self, mocked_request):
+        mocked_request.side_effect = get_pages(3)[:2] + [utils_.KlaviyoBadRequestError("bad")]
+        with self.assertRaises(utils_.KlaviyoBadRequestError):
+            self.pull({"state_emit_interval_pages": 100})
+        self.assertEqual(self.states, [utils_.ts_to_dt(START)])
@@ -0,0 +1,129 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import requests
+import simplejson
+from urllib3.exceptions import ProtocolError
+
+import tap_klaviyo
+import tap_klaviyo.utils as utils_
+from tap_klaviyo import streaming
+
+PAGE = {
+    "data": [
+        {"type": "campaign", "id": "c1", "attributes": {"name": "first", "archived": False},
+         "relationships": {"campaign-messages": {"data": [{"type": "campaign-message", "id": "m1"}]},
+                           "tags": {"data": []}}},
+        {"type": "campaign", "id": "c2", "attributes": {"name": "second", "archived": True},
+         "relationships": {"campaign-messages": {"data": []}, "tags": {"data": []}}},
+    ],
+    "links": {"self": "self", "next": None},
+    "included": [
+        {"type": "campaign-message", "id": "m1", "attributes": {"label": "message"}},
+    ],
+}
+
+
+class MockStreamedResponse:
+    def __init__(self, resp):
+        self.status_code = 200
+        self.headers = {}
+        self.content = json.dumps(resp).encode()
+        self.raw = io.BytesIO(self.content)
+        self.closed = False
+
+    def json(self):
+        return json.loads(self.content)
+
+    def close(self):
+        self.closed = True
+
+
+@unittest.skipIf(streaming.ijson is None, "ijson is not installed")
+class TestStreamedPage(unittest.TestCase):
+
+    def test_top_level_items(self):
+        items = list(streaming.iter_top_level_items(io.BytesIO(json.dumps(PAGE).encode())))
+
+        self.assertEqual([kind for kind, _ in items], ["data", "data", "links", "included"])
+        self.assertEqual(items[0][1], PAGE["data"][0])
+        self.assertEqual(items[2][1], PAGE["links"])
+
+    def test_records_are_resolved_as_soon_as_possible(self):
+        """Verify that a record without pending relationships is yielded before the ones waiting for `included`"""
+        response = MockStreamedResponse(PAGE)
+        page = streaming.StreamedPage(response)
+
+        with mock.patch.object(streaming, "STREAM_BATCH_SIZE", 1):
+            batches = list(page.iter_batches(["tags", "campaign-messages"]))
+
+        self.assertEqual([[record["id"] for record in records] for records, _ in batches], [["c2"], ["c1"]])
+        self.assertEqual(batches[1][1], {("campaign-message", "m1"): PAGE["included"][0]})
+        self.assertIsNone(page.next_url)
+        self.assertTrue(response.closed)
+
+    def test_missing_included_relationship_is_left_unresolved(self):
+        page_without_included = {**PAGE, "included": []}
+        page = streaming.StreamedPage(MockStreamedResponse(page_without_included))
+
+        records = [record["id"] for records, _ in page.iter_batches(["campaign-messages"]) for record in records]
+
+        self.assertEqual(sorted(records), ["c1", "c2"])
+
+
+@unittest.skipIf(streaming.ijson is None, "ijson is not installed")
+class TestStreamedFullPull(unittest.TestCase):
+
+    def tearDown(self):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({}))
+
+    def get_output(self, config):
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config(config))
+        stream = tap_klaviyo.CAMPAIGNS.to_catalog_dict()
+        output = io.StringIO()
+        with mock.patch("requests.Session.request", side_effect=lambda **kwargs: MockStreamedResponse(PAGE)):
+            with redirect_stdout(output):
+                utils_.get_full_pulls(stream, "https://a.klaviyo.com/api/campaigns", {}, {})
+        # The table version differs between the syncs
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+        return sorted(json.dumps(message["record"], sort_keys=True)
+                      for message in messages if message["type"] == "RECORD")
+
+    def test_streamed_records_are_identical(self):
+        """Verify that the streaming parse writes the same records as decoding the whole page"""
+        self.assertEqual(self.get_output({"streaming_parse": True}), self.get_output({}))
+
+    def test_page_is_requested_again_when_its_body_cannot_be_read(self):
+        """Verify that a truncated and a reset body are retried from the URL of the page"""
+        responses = [MockStreamedResponse(PAGE), MockStreamedResponse(PAGE), MockStreamedResponse(PAGE)]
+        responses[0].raw = io.BytesIO(responses[0].content[:40])
+        responses[1].raw = mock.Mock(read=mock.Mock(side_effect=ProtocolError("Connection reset by peer")))
+        utils_.set_runtime_settings(utils_.RuntimeSettings.from_config({"streaming_parse": True}))
+        output = io.StringIO()
+        with mock.patch("requests.Session.request", side_effect=responses) as mocked_request, \
+                redirect_stdout(output):
+            utils_.get_full_pulls(tap_klaviyo.CAMPAIGNS.to_catalog_dict(), "https://a.klaviyo.com/api/campaigns",
+                                  {}, {})
+
+        self.assertEqual(mocked_request.call_count, 3)
+        self.assertEqual({call.kwargs["url"] for call in mocked_request.call_args_list},
+                         {"https://a.klaviyo.com/api/campaigns"})
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(sorted(message["record"]["id"] for message in records if message["type"] == "RECORD"),
+                         ["c1", "c2"])
+
+    def test_read_errors_are_raised_as_request_errors(self):
+        response = MockStreamedResponse(PAGE)
+        response.raw = mock.Mock(read=mock.Mock(side_effect=ProtocolError("Connection reset by peer")))
+
+        with self.assertRaises(requests.ConnectionError):
+            list(streaming.StreamedPage(response).iter_batches(["tags"]))
+        self.assertTrue(response.closed)
+
+        response = MockStreamedResponse(PAGE)
+        response.raw = io.BytesIO(response.content[:40])
+        with self.assertRaises(simplejson.JSONDecodeError):
+            list(streaming.StreamedPage(response).iter_batches(["tags"]))
@@ -5,14 +5,6 @@ from unittest import mock
 
 import tap_klaviyo.utils as utils
 
-class MockParseArgs:
-    config = {}
-    def __init__(self, config):
-        self.config = config
-
-def get_args(config):
-    return MockParseArgs(config)
-
 @mock.patch("time.sleep")
 @mock.patch("requests.Session.request")
 @mock.patch("singer.utils.parse_args")
@@ -21,11 +13,11 @@ class TestTimeoutValue(unittest.TestCase):
     def test_timeout_value_in_config(self, mocked_parse_args, mocked_request, mocked_sleep):
 
         mock_config = {"request_timeout": 100}
-        # mock parse args
-        mocked_parse_args.return_value = get_args(mock_config)
+        # resolve the runtime settings once, as `main()` does
+        utils.set_runtime_settings(utils.RuntimeSettings.from_config(mock_config))
 
         # get the timeout value for assertion
-        timeout = utils.get_request_timeout()
+        timeout = utils.get_request_timeout(mock_config)
         # function call
         utils.authed_get("test_source", "", "", "")
 
@@ -33,15 +25,17 @@ class TestTimeoutValue(unittest.TestCase):
         self.assertEqual(100.0, timeout)
         # verify that the request was called with expected timeout value
         mocked_request.assert_called_with(method='get', url='', params='', headers='', timeout=100.0)
+        # verify that the request path never parses argv or reads the config file
+        mocked_parse_args.assert_not_called()
 
     def test_timeout_value_not_in_config(self, mocked_parse_args, mocked_request, mocked_sleep):
 
         mock_config = {}
-        # mock parse args
-        mocked_parse_args.return_value = get_args(mock_config)
+        # resolve the runtime settings once, as `main()` does
+        utils.set_runtime_settings(utils.RuntimeSettings.from_config(mock_config))
 
         # get the timeout value for assertion
-        timeout = utils.get_request_timeout()
+        timeout = utils.get_request_timeout(mock_config)
         # function call
         utils.authed_get("test_source", "", "","")
 
@@ -49,15 +43,17 @@ class TestTimeoutValue(unittest.TestCase):
         self.assertEqual(300.0, timeout)
         # verify that the request was called with expected timeout value
         mocked_request.assert_called_with(method='get', url='', params='', headers='', timeout=300.0)
+        # verify that the request path never parses argv or reads the config file
+        mocked_parse_args.assert_not_called()
 
     def test_timeout_string_value_in_config(self, mocked_parse_args, mocked_request, mocked_sleep):
 
         mock_config = {"request_timeout": "100"}
-        # mock parse args
-        mocked_parse_args.return_value = get_args(mock_config)
+        # resolve the runtime settings once, as `main()` does
+        utils.set_runtime_settings(utils.RuntimeSettings.from_config(mock_config))
 
         # get the timeout value for assertion
-        timeout = utils.get_request_timeout()
+        timeout = utils.get_request_timeout(mock_config)
         # function call
         utils.authed_get("test_source", "", "","")
 
@@ -65,15 +61,17 @@ class TestTimeoutValue(unittest.TestCase):
         self.assertEqual(100.0, timeout)
         # verify that the request was called with expected timeout value
         mocked_request.assert_called_with(method='get', url='', params='', headers='', timeout=100.0)
+        # verify that the request path never parses argv or reads the config file
+        mocked_parse_args.assert_not_called()
 
     def test_timeout_empty_value_in_config(self, mocked_parse_args, mocked_request, mocked_sleep):
 
         mock_config = {"request_timeout": ""}
-        # mock parse args
-        mocked_parse_args.return_value = get_args(mock_config)
+        # resolve the runtime settings once, as `main()` does
+        utils.set_runtime_settings(utils.RuntimeSettings.from_config(mock_config))
 
         # get the timeout value for assertion
-        timeout = utils.get_request_timeout()
+        timeout = utils.get_request_timeout(mock_config)
         # function call
         utils.authed_get("test_source", "", "","")
 
@@ -81,15 +79,17 @@ class TestTimeoutValue(unittest.TestCase):
         self.assertEqual(300.0, timeout)
         # verify that the request was called with expected timeout value
         mocked_request.assert_called_with(method='get', url='', params='',  headers='', timeout=300.0)
+        # verify that the request path never parses argv or reads the config file
+        mocked_parse_args.assert_not_called()
 
     def test_timeout_0_value_in_config(self, mocked_parse_args, mocked_request, mocked_sleep):
 
         mock_config = {"request_timeout": 0.0}
-        # mock parse args
-        mocked_parse_args.return_value = get_args(mock_config)
+        # resolve the runtime settings once, as `main()` does
+        utils.set_runtime_settings(utils.RuntimeSettings.from_config(mock_config))
 
         # get the timeout value for assertion
-        timeout = utils.get_request_timeout()
+        timeout = utils.get_request_timeout(mock_config)
         # function call
         utils.authed_get("test_source", "", "","")
 
@@ -97,15 +97,17 @@ class TestTimeoutValue(unittest.TestCase):
         self.assertEqual(300.0, timeout)
         # verify that the request was called with expected timeout value
         mocked_request.assert_called_with(method='get', url='', params='',  headers='', timeout=300.0)
+        # verify that the request path never parses argv or reads the config file
+        mocked_parse_args.assert_not_called()
 
     def test_timeout_string_0_value_in_config(self, mocked_parse_args, mocked_request, mocked_sleep):
 
         mock_config = {"request_timeout": "0.0"}
-        # mock parse args
-        mocked_parse_args.return_value = get_args(mock_config)
+        # resolve the runtime settings once, as `main()` does
+        utils.set_runtime_settings(utils.RuntimeSettings.from_config(mock_config))
 
         # get the timeout value for assertion
-        timeout = utils.get_request_timeout()
+        timeout = utils.get_request_timeout(mock_config)
         # function call
         utils.authed_get("test_source", "", "","")
 
@@ -113,6 +115,8 @@ class TestTimeoutValue(unittest.TestCase):
         self.assertEqual(300.0, timeout)
         # verify that the request was called with expected timeout value
         mocked_request.assert_called_with(method='get', url='', params='',  headers='', timeout=300.0)
+        # verify that the request path never parses argv or reads the config file
+        mocked_parse_args.assert_not_called()
 
 @mock.patch("time.sleep")
 @mock.patch("requests.Session.request")
@@ -125,8 +129,8 @@ class TestTimeoutAndConnectionErrorBackoff(unittest.TestCase):
         mocked_request.side_effect = requests.Timeout
 
         mock_config = {}
-        # mock parse args
-        mocked_parse_args.return_value = get_args(mock_config)
+        # resolve the runtime settings once, as `main()` does
+        utils.set_runtime_settings(utils.RuntimeSettings.from_config(mock_config))
 
         try:
             # function call
@@ -143,8 +147,8 @@ class TestTimeoutAndConnectionErrorBackoff(unittest.TestCase):
         mocked_request.side_effect = requests.ConnectionError
 
         mock_config = {}
-        # mock parse args
-        mocked_parse_args.return_value = get_args(mock_config)
+        # resolve the runtime settings once, as `main()` does
+        utils.set_runtime_settings(utils.RuntimeSettings.from_config(mock_config))
 
         try:
             # function call
@@ -154,3 +158,24 @@ class TestTimeoutAndConnectionErrorBackoff(unittest.TestCase):
 
         # verify that we backoff for 5 times
         self.assertEqual(5, mocked_request.call_count)
+
+class TestRuntimeSettings(unittest.TestCase):
+
+    def tearDown(self):
+        utils.set_runtime_settings(utils.RuntimeSettings.from_config({}))
+
+    def test_runtime_settings_from_config(self):
+        """Verify that the settings are resolved from the config with their defaults"""
+        settings = utils.RuntimeSettings.from_config({"request_timeout": "50", "page_size": 500})
+
+        self.assertEqual(settings.request_timeout, 50.0)
+        self.assertEqual(settings.page_size, 500)
+        self.assertEqual(settings.pool_size, utils.POOL_SIZE)
+        self.assertEqual(settings.connection_retries, utils.CONNECTION_RETRIES)
+
+    def test_page_size_params(self):
+        """Verify that `page[size]` is only sent to supported endpoints and capped at their maximum"""
+        utils.set_runtime_settings(utils.RuntimeSettings.from_config({"page_size": 500}))
+
+        self.assertEqual(utils.get_page_size_params("global_exclusions"), {"page[size]": 100})
+        self.assertEqual(utils.get_page_size_params("lists"), {})
@@ -0,0 +1,138 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from singer import metadata
+
+import tap_klaviyo
+import tap_klaviyo.utils as utils_
+from helpers import MockResponse, get_event_stream
+
+def get_profile(profile_id, updated):
+    return {"type": "profile", "id": profile_id, "attributes": {"updated": updated}}
+
+
+def get_stream(replication_method="INCREMENTAL", stream=tap_klaviyo.GLOBAL_EXCLUSIONS):
+    stream = stream.to_catalog_dict()
+    mdata = metadata.write(metadata.to_map(stream["metadata"]), (), "replication-method", replication_method)
+    stream["metadata"] = metadata.to_list(mdata)
+    return stream
+
+
+class TestUpdatedPulls(unittest.TestCase):
+
+    def pull(self, state, profiles_by_filter):
+        requested = []
+
+        def request(**kwargs):
+            requested.append(kwargs["params"]["filter"])
+            return MockResponse({"data": profiles_by_filter.get(len(requested) - 1, []), "links": {}})
+
+        output = io.StringIO()
+        with mock.patch("requests.Session.request", side_effect=request), redirect_stdout(output):
+            tap_klaviyo.sync_stream(get_stream(), state, {}, "2023-01-01T00:00:00Z")
+        return requested, [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_every_suppression_reason_is_filtered_on_updated(self):
+        state = {"bookmarks": {"global_exclusions": {"since": "2024-05-01T10:00:00Z"}}}
+        requested, _ = self.pull(state, {})
+
+        self.assertEqual(requested, [params["filter"] + ",greater-than(updated,2024-05-01T10:00:00Z)"
+                                     for params in utils_.STREAM_PARAMS_MAP["global_exclusions"]])
+
+    def test_start_date_is_used_without_bookmark(self):
+        requested, _ = self.pull({"bookmarks": {}}, {})
+
+        self.assertTrue(all(value.endswith(",greater-than(updated,2023-01-01T00:00:00Z)") for value in requested))
+
+    def test_bookmark_is_the_latest_updated_of_all_the_params_sets(self):
+        state = {"bookmarks": {}}
+        _, messages = self.pull(state, {
+            0: [get_profile("p1", "2024-02-01T00:00:00+00:00")],
+            2: [get_profile("p2", "2024-03-01T12:30:00.123456+00:00"), get_profile("p3", "2024-01-01T00:00:00+00:00")],
+        })
+
+        self.assertEqual([message["record"]["id"] for message in messages if message["type"] == "RECORD"],
+                         ["p1", "p2", "p3"])
+        self.assertEqual(state["bookmarks"]["global_exclusions"], {"since": "2024-03-01T12:30:00Z"})
+        # the bookmark is written once all the params sets are complete
+        self.assertEqual([message["type"] for message in messages][-1], "STATE")
+        self.assertFalse(any(message["type"] == "ACTIVATE_VERSION" for message in messages))
+
+    def test_bookmark_is_kept_without_updated_records(self):
+        state = {"bookmarks": {"global_exclusions": {"since": "2024-05-01T10:00:00Z", "version": 1}}}
+        self.pull(state, {})
+
+        self.assertEqual(state["bookmarks"]["global_exclusions"], {"since": "2024-05-01T10:00:00Z", "version": 1})
+
+    def test_full_table_sync_keeps_the_incremental_bookmark(self):
+        state = {"bookmarks": {"global_exclusions": {"since": "2024-05-01T10:00:00Z"}}}
+        with mock.patch("requests.Session.request", return_value=MockResponse({"data": [], "links": {}})), \
+                redirect_stdout(io.StringIO()):
+            tap_klaviyo.sync_stream(get_stream("FULL_TABLE"), state, {}, "2023-01-01T00:00:00Z")
+
+        self.assertEqual(state["bookmarks"]["global_exclusions"]["since"], "2024-05-01T10:00:00Z")
+        self.assertIn("version", state["bookmarks"]["global_exclusions"])
+
+
+class TestReplicationMethodMetadata(unittest.TestCase):
+
+    def test_replication_method_is_chosen_in_the_catalog(self):
+        mdata = metadata.to_map(tap_klaviyo.GLOBAL_EXCLUSIONS.to_catalog_dict()["metadata"])
+
+        self.assertEqual(mdata[()]["replication-method"], "FULL_TABLE")
+        self.assertEqual(mdata[()]["valid-replication-keys"], ["updated"])
+        self.assertNotIn("forced-replication-method", mdata[()])
+        # the replication key can not be deselected, the bookmark of an incremental sync is read from it
+        self.assertEqual(mdata[("properties", "updated")]["inclusion"], "automatic")
+        self.assertEqual(mdata[("properties", "email")]["inclusion"], "available")
+        self.assertEqual(utils_.get_replication_method(get_stream()), "INCREMENTAL")
+
+    def test_forced_replication_method_is_unchanged(self):
+        stream = get_event_stream()
+
+        self.assertEqual(metadata.to_map(stream["metadata"])[()]["forced-replication-method"], "INCREMENTAL")
+        self.assertEqual(utils_.get_replication_method(stream), "INCREMENTAL")
+
+
+class TestUpdatedCampaigns(unittest.TestCase):
+
+    def test_channel_filter_is_combined_with_updated_at(self):
+        state = {"bookmarks": {"campaigns": {"since": "2024-05-01T10:00:00Z"}}}
+        campaign = {"type": "campaign", "id": "c1", "attributes": {"updated_at": "2024-06-01T08:00:00+00:00"},
+                    "relationships": {"tags": {"data": []}}}
+        requests = []
+
+        def request(**kwargs):
+            requests.append(kwargs["params"])
+            return MockResponse({"data": [campaign], "links": {}})
+
+        with mock.patch("requests.Session.request", side_effect=request), redirect_stdout(io.StringIO()):
+            tap_klaviyo.sync_stream(get_stream(stream=tap_klaviyo.CAMPAIGNS), state, {}, "2023-01-01T00:00:00Z")
+
+        self.assertEqual(requests, [{"filter": "equals(messages.channel,'email'),"
+                                               "greater-than(updated_at,2024-05-01T10:00:00Z)",
+                                     "include": "tags,campaign-messages"}])
+        self.assertEqual(state["bookmarks"]["campaigns"], {"since": "2024-06-01T08:00:00Z"})
+
+
+class TestUpdatedLists(unittest.TestCase):
+
+    def test_lists_are_filtered_on_updated(self):
+        state = {"bookmarks": {"lists": {"since": "2024-05-01T10:00:00Z", "version": 1}}}
+        lst = {"type": "list", "id": "l1", "attributes": {"updated": "2024-05-02T00:00:00+00:00"},
+               "relationships": {"tags": {"data": []}}}
+        requests = []
+
+        def request(**kwargs):
+            requests.append(kwargs["params"])
+            return MockResponse({"data": [lst], "links": {}})
+
+        with mock.patch("requests.Session.request", side_effect=request), redirect_stdout(io.StringIO()):
+            tap_klaviyo.sync_stream(get_stream(stream=tap_klaviyo.LISTS), state, {}, "2023-01-01T00:00:00Z")
+
+        self.assertEqual(requests, [{"filter": "greater-than(updated,2024-05-01T10:00:00Z)", "include": "tags"}])
+        # the version of the full table syncs used for reconciliation is kept
+        self.assertEqual(state["bookmarks"]["lists"], {"since": "2024-05-02T00:00:00Z", "version": 1})